@@ -0,0 +1,93 @@
+"""Release skew and Redis commands of a sync group barrier against the slot count, former polling against BLPOP.
+
+Usage, from the repository root:
+
+python -m benchmarks.barrier
+python -m benchmarks.barrier --slots 2 8 32 --rounds 50 --stagger .1 --port 6379
+
+Every slot is a process, as the containers of a station. In each round the slots arrive at the barrier within stagger
+seconds. The skew is the time between the first and the last slot leaving the barrier, the wake up the time between
+the last slot arriving and the last one leaving. The commands and round trips are counted per slot and per round.
+
+barrier is engine.sync_groups.barrier as sync_group calls it. former is the loop sync_group had before it: SADD, then
+SCARD twice and HKEYS every 9 ms until every running container arrived, then DEL.
+"""
+import time
+import random
+import argparse
+import statistics
+import multiprocessing
+from engine import sync_groups
+from benchmarks import common
+
+RUNNING = f'{common.GROUP}::running'
+
+
+def former_barrier(group, slot, running):
+    """The wait of sync_group before engine.sync_groups.barrier."""
+    RDB = sync_groups.RDB
+    RDB.sadd(group, slot)
+    while True:
+        if RDB.scard(group) <= 0 or RDB.scard(group) == len(RDB.hkeys(running)):
+            break
+        time.sleep(.009)
+    RDB.delete(group)
+
+
+def slot_process(mode, slot, host, port, rounds, stagger, start, results):
+    common.use_redis(host, port)
+    rnd = random.Random(slot)
+    times = []
+    for r in range(rounds + 1):
+        start.wait()
+        time.sleep(rnd.uniform(0, stagger))
+        common.COUNTS.update(commands=0, round_trips=0)
+        group = f'{common.GROUP}::{mode}::{r}'
+        arrived = time.monotonic()
+        if mode == 'former':
+            former_barrier(group, slot, RUNNING)
+        else:
+            sync_groups.barrier(group, slot, running=RUNNING, timeout=10, wait=10)
+        times.append((arrived, time.monotonic(), common.COUNTS['commands'], common.COUNTS['round_trips']))
+    results.put(times[1:])
+
+
+def run(mode, slots, host, port, rounds, stagger):
+    """:return: (skews in ms, wake ups in ms, commands per slot per round, round trips per slot per round)"""
+    rdb = common.use_redis(host, port)
+    rdb.delete(RUNNING)
+    rdb.hset(RUNNING, mapping=dict((f'slot{i}', '') for i in range(slots)))
+    start, results = multiprocessing.Barrier(slots), multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=slot_process, args=(mode, f'slot{i}', host, port, rounds, stagger,
+                                                                    start, results)) for i in range(slots)]
+    [p.start() for p in processes]
+    per_slot = [results.get(timeout=600) for _ in processes]
+    [p.join() for p in processes]
+    rounds = list(zip(*per_slot))
+    skews = [(max(t[1] for t in r) - min(t[1] for t in r)) * 1000 for r in rounds]
+    wake_ups = [(max(t[1] for t in r) - max(t[0] for t in r)) * 1000 for r in rounds]
+    commands = statistics.mean(t[2] for r in rounds for t in r)
+    round_trips = statistics.mean(t[3] for r in rounds for t in r)
+    return skews, wake_ups, commands, round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    common.add_redis_arguments(parser)
+    parser.add_argument('--slots', type=int, nargs='+', default=[2, 4, 8, 16])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--stagger', type=float, default=.05, help='seconds over which the slots arrive')
+    args = parser.parse_args()
+
+    host, port, description = common.redis_server(args)
+    print(f'{description}, {args.rounds} rounds, arrivals over {args.stagger * 1000:g} ms')
+    print(f'{"slots":>5}  {"mode":<8}{"skew ms":>9}{"skew max":>10}{"wake ms":>9}{"commands":>10}{"round trips":>13}')
+    for slots in args.slots:
+        for mode in ('former', 'barrier'):
+            skews, wake_ups, commands, round_trips = run(mode, slots, host, port, args.rounds, args.stagger)
+            print(f'{slots:>5}  {mode:<8}{statistics.median(skews):>9.2f}{max(skews):>10.2f}'
+                  f'{statistics.median(wake_ups):>9.2f}{commands:>10.1f}{round_trips:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Station set up shared by the benchmarks: a Redis server, the slots of a sync group and the Robot variables."""
+import socket
+import tempfile
+import multiprocessing
+from engine import utils
+from engine import conn
+from engine import redis_lib
+from engine import logger as log
+
+GROUP = 'bench'
+COUNTS = {'commands': 0, 'round_trips': 0}
+
+
+def add_redis_arguments(parser):
+    parser.add_argument('--host', default='localhost', help='Redis server, a fakeredis one is started if unreachable')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--fake', action='store_true', help='use a fakeredis TCP server even if Redis is reachable')
+
+
+def redis_server(args):
+    """Returns (host, port, description) of the Redis server to use, starting a fakeredis one when needed."""
+    if not args.fake:
+        try:
+            socket.create_connection((args.host, args.port), timeout=.5).close()
+            return args.host, args.port, f'redis-server {args.host}:{args.port}'
+        except OSError:
+            pass
+    ports = multiprocessing.Queue()
+    multiprocessing.Process(target=fake_redis, args=(ports,), daemon=True).start()
+    port = ports.get(timeout=10)
+    return '127.0.0.1', port, f'fakeredis TCP server on port {port}'
+
+
+def fake_redis(ports):
+    """Serves a fakeredis TCP server in its own process, so it does not share the GIL with the measured clients.
+
+    Its replies to a pipeline are sent one by one, TCP_NODELAY keeps them from waiting for the delayed ACKs.
+    """
+    from fakeredis import TcpFakeServer
+
+    class Server(TcpFakeServer):
+        def get_request(self):
+            request, address = super().get_request()
+            request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return request, address
+
+    server = Server(('127.0.0.1', 0))
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def use_redis(host, port):
+    """Points engine.redis_lib.RDB, shared by every engine module, to host:port. Call it again in a forked process.
+
+    The commands sent and the round trips to the server are counted in COUNTS.
+    """
+    import redis
+
+    class CountingConnection(redis.Connection):
+        def send_command(self, *args, **kwargs):
+            COUNTS['commands'] += 1
+            COUNTS['round_trips'] += 1
+            return super().send_command(*args, **kwargs)
+
+        def pack_commands(self, commands):
+            commands = list(commands)
+            COUNTS['commands'] += len(commands)
+            COUNTS['round_trips'] += 1
+            return super().pack_commands(commands)
+
+    pool = redis.ConnectionPool(host=host, port=port, decode_responses=True, connection_class=CountingConnection)
+    redis_lib.RDB._client = redis.StrictRedis(connection_pool=pool)
+    return redis_lib.RDB
+
+
+def station(slots, timeout=60):
+    """Configures slots containers in one sync group, as a station configuration does.
+
+    :return: the slot names.
+    """
+    names = [f'slot{i}' for i in range(slots)]
+    containers = [conn.StationConfiguration.add_container(name) for name in names]
+    conn.StationConfiguration.add_sync_group(GROUP, containers, timeout=timeout)
+    log.set_level('ERROR')
+    return names
+
+
+def set_slot(slot):
+    """Sets the Robot variables the engine reads in the container of slot."""
+    utils.VARIABLES.update({'${slot_location}': slot, '${TEST NAME}': 'benchmark', '${test_mode}': 'benchmark',
+                            '${Raw_logs_path}': tempfile.gettempdir()})
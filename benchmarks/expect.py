@@ -0,0 +1,84 @@
+"""Per chunk cost of matching expect phrases while a console response grows.
+
+Usage, from the repository root:
+
+python -m benchmarks.expect
+python -m benchmarks.expect --sizes 256 1024 4096 --chunk 1024
+
+Compares the former Client.expectphrase scan, `s in response` and re.search over the whole response after every
+chunk, with engine.protocols.ExpectMatcher. The phrases are never found, as while waiting for a prompt during a boot.
+"""
+import re
+import time
+import random
+import argparse
+from engine import utils
+from engine.protocols import ExpectMatcher
+
+PHRASES = {'plain': ['login:'],
+           'bounded regex': [r'[Ll]ogin:', r'ERROR \d{3}'],
+           'prompt .*': [r'\[root@.*\]#'],
+           'prompt \\s+$': [r'\$\s+$'],
+           'boot .*': [r'Booting.*login:']}
+
+
+def console(size, seed=0):
+    """Boot console like text of size characters, without any of the PHRASES."""
+    rnd = random.Random(seed)
+    words = ['kernel', 'pci', '0000:00:1f.2', 'eth0', 'link', 'up', 'mounted', '[ OK ]', 'usb', '3-1:', 'sda1',
+             'systemd[1]:', 'Started', '0x7f', 'irq', '#12', 'mem=4096M', '$PATH', 'ok']
+    lines, length = [], 0
+    while length < size:
+        lines.append(f'[{rnd.uniform(0, 99):12.6f}] ' + ' '.join(rnd.choice(words) for _ in range(rnd.randint(3, 12))))
+        length += len(lines[-1]) + 1
+    return '\n'.join(lines)[:size]
+
+
+def former(expect, response, data):
+    response += data
+    for s in expect:
+        if s in response or re.search(s, response, re.DOTALL):
+            return response, True
+    return response, False
+
+
+def per_chunk(expect, text, sizes, chunk, samples):
+    """:return: {size: (former us per chunk, ExpectMatcher us per chunk)} measured over samples chunks at size."""
+    results = {}
+    matcher = ExpectMatcher(expect)
+    position = 0
+    for size in sizes:
+        while position < size - samples * chunk:
+            matcher.feed(text[position:position + chunk])
+            position += chunk
+        start = time.perf_counter()
+        for i in range(samples):
+            matcher.feed(text[position + i * chunk:position + (i + 1) * chunk])
+        new = (time.perf_counter() - start) / samples
+        response = text[:position]
+        start = time.perf_counter()
+        for i in range(samples):
+            response, _ = former(expect, response, text[position + i * chunk:position + (i + 1) * chunk])
+        old = (time.perf_counter() - start) / samples
+        position += samples * chunk
+        results[size] = (old * 1e6, new * 1e6)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 256, 1024, 4096], help='response sizes in KB')
+    parser.add_argument('--chunk', type=int, default=1024, help='characters per chunk')
+    parser.add_argument('--samples', type=int, default=16, help='chunks timed at every size')
+    args = parser.parse_args()
+
+    sizes = [size * 1024 for size in sorted(args.sizes)]
+    text = console(sizes[-1] + args.samples * args.chunk)
+    print(f'{"phrases":<16}' + ''.join(f'{size // 1024:>9} KB former/new us' for size in sizes))
+    for name, expect in PHRASES.items():
+        results = per_chunk(expect, text, sizes, args.chunk, args.samples)
+        print(f'{name:<16}' + ''.join(f'{results[size][0]:>14.0f} /{results[size][1]:>8.1f}' for size in sizes))
+
+
+if __name__ == '__main__':
+    main()
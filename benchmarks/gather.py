@@ -0,0 +1,90 @@
+"""Latency and Redis round trips of gathering one value per slot against the slot count, former against sync_gather.
+
+Usage, from the repository root:
+
+python -m benchmarks.gather
+python -m benchmarks.gather --slots 2 8 32 --rounds 50 --port 6379
+
+Every slot is a process, as the containers of a station. In each round every slot contributes a measurement, the
+slots arrive within stagger seconds. The latency is the time between the last slot arriving and the last one having
+the values of every slot. The commands and round trips are counted per slot and per round.
+
+former is what sequences did before sync_gather: cache_data of its own value, sync_group, then get_cached_data of
+the value of every slot. sync_gather is engine.sync_groups.sync_gather.
+"""
+import time
+import random
+import argparse
+import statistics
+import multiprocessing
+from engine import utils
+from engine import sync_groups
+from benchmarks import common
+
+
+def former_gather(group, value, slots):
+    utils.cache_data(f'{group}::{utils.get_variable("${slot_location}")}', value)
+    sync_groups.sync_group(group)
+    return dict((slot, utils.get_cached_data(f'{group}::{slot}')) for slot in slots)
+
+
+def slot_process(mode, slot, slots, host, port, rounds, stagger, start, results):
+    common.use_redis(host, port)
+    common.set_slot(slot)
+    rnd = random.Random(slot)
+    times = []
+    for r in range(rounds + 1):
+        start.wait()
+        time.sleep(rnd.uniform(0, stagger))
+        common.COUNTS.update(commands=0, round_trips=0)
+        value = f'{rnd.uniform(0, 5):.4f}'
+        arrived = time.monotonic()
+        if mode == 'former':
+            values = former_gather(f'gather{r}', value, slots)
+        else:
+            values = sync_groups.sync_gather(f'gather{r}', value)
+        assert len(values) == len(slots) and values[slot] == value, values
+        times.append((arrived, time.monotonic(), common.COUNTS['commands'], common.COUNTS['round_trips']))
+    results.put(times[1:])
+
+
+def run(mode, slots, host, port, rounds, stagger):
+    """:return: (latencies in ms, commands per slot per round, round trips per slot per round)"""
+    rdb = common.use_redis(host, port)
+    rdb.delete(common.GROUP)
+    rdb.hset(common.GROUP, mapping=dict((slot, '') for slot in slots))
+    start, results = multiprocessing.Barrier(len(slots)), multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=slot_process, args=(mode, slot, slots, host, port, rounds, stagger,
+                                                                    start, results)) for slot in slots]
+    [p.start() for p in processes]
+    per_slot = [results.get(timeout=600) for _ in processes]
+    [p.join() for p in processes]
+    rounds = list(zip(*per_slot))
+    latencies = [(max(t[1] for t in r) - max(t[0] for t in r)) * 1000 for r in rounds]
+    commands = statistics.mean(t[2] for r in rounds for t in r)
+    round_trips = statistics.mean(t[3] for r in rounds for t in r)
+    return latencies, commands, round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    common.add_redis_arguments(parser)
+    parser.add_argument('--slots', type=int, nargs='+', default=[2, 4, 8, 16])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--stagger', type=float, default=.01, help='seconds over which the slots arrive')
+    args = parser.parse_args()
+
+    host, port, description = common.redis_server(args)
+    print(f'{description}, {args.rounds} rounds, arrivals over {args.stagger * 1000:g} ms')
+    print(f'{"slots":>5}  {"mode":<12}{"median ms":>10}{"p95 ms":>10}{"commands":>10}{"round trips":>13}')
+    for n in args.slots:
+        slots = common.station(n)
+        for mode in ('former', 'sync_gather'):
+            latencies, commands, round_trips = run(mode, slots, host, port, args.rounds, args.stagger)
+            p95 = statistics.quantiles(latencies, n=20)[-1]
+            print(f'{n:>5}  {mode:<12}{statistics.median(latencies):>10.2f}{p95:>10.2f}{commands:>10.1f}'
+                  f'{round_trips:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
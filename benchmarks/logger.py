@@ -0,0 +1,84 @@
+"""Throughput of engine.logger, former open/close per line against the background writer.
+
+Usage, from the repository root:
+
+python -m benchmarks.logger
+python -m benchmarks.logger --lines 50000 --threads 1 4 --size 200
+
+threads threads, as the containers of a station, each log lines INFO lines of size characters. The former logger is
+the one engine.logger had before engine.writer: it checked the log directory, then opened, appended to and closed the
+test log and sequences_logs.txt for every line. The writer figures include the final flush, so every line is on disk.
+The caller column is the time a log.info call blocks the test, the p99 over every line.
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+from datetime import datetime
+from engine import utils
+from engine import logger as log
+
+
+def former_timestamp_log(msg):
+    """engine.logger.timestamp_log before engine.writer."""
+    raw_path = utils.get_variable("${Raw_logs_path}")
+    test_name = utils.get_variable("${TEST NAME}")
+    test_mode = utils.get_variable('${test_mode}')
+    os.makedirs(f'{raw_path}') if not os.path.isdir(f'{raw_path}') else None
+    for i in [test_name, 'sequences_logs']:
+        with open(f'{raw_path}/{i}.txt', 'a+', encoding="utf-8") as f:
+            if i == 'sequences_logs':
+                f.write(f'[{datetime.now().isoformat()[:-3]}]|{test_mode}|{test_name}|: {msg}\r')
+            else:
+                f.write(f'[{datetime.now().isoformat()[:-3]}]: {msg}\r')
+
+
+def former_info(msg):
+    former_timestamp_log(msg=f'{"INFO":<8}: {msg}')
+
+
+def worker(info, lines, msg, calls):
+    for i in range(lines):
+        start = time.perf_counter()
+        info(f'{i:08d} {msg}')
+        calls.append(time.perf_counter() - start)
+
+
+def run(logger, threads, lines, msg):
+    """:return: (lines per second, p99 caller ms, bytes written)"""
+    raw_path = tempfile.mkdtemp(prefix='benchmark-logger-')
+    utils.VARIABLES.update({'${Raw_logs_path}': raw_path, '${TEST NAME}': 'benchmark', '${test_mode}': 'benchmark'})
+    info = former_info if logger == 'former' else log.info
+    calls = [[] for _ in range(threads)]
+    workers = [threading.Thread(target=worker, args=(info, lines, msg, c)) for c in calls]
+    start = time.perf_counter()
+    [w.start() for w in workers]
+    [w.join() for w in workers]
+    log.flush(close=True)
+    elapsed = time.perf_counter() - start
+    written = sum(os.path.getsize(os.path.join(raw_path, name)) for name in os.listdir(raw_path))
+    shutil.rmtree(raw_path)
+    p99 = statistics.quantiles([t for c in calls for t in c], n=100)[-1] * 1000
+    return threads * lines / elapsed, p99, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=20000, help='lines per thread')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--size', type=int, default=80, help='characters per line')
+    args = parser.parse_args()
+
+    msg = ('x' * args.size)[:max(0, args.size - 9)]
+    print(f'{"threads":>7}  {"logger":<8}{"lines/s":>12}{"caller p99 ms":>15}{"MB written":>12}')
+    for threads in args.threads:
+        for logger in ('former', 'writer'):
+            rate, p99, written = run(logger, threads, args.lines, msg)
+            print(f'{threads:>7}  {logger:<8}{rate:>12,.0f}{p99:>15.3f}{written / 2 ** 20:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Prompt latency and CPU time of the Client receive loop, former busy polling against select.
+
+Usage, from the repository root:
+
+python -m benchmarks.recv
+python -m benchmarks.recv --prompts 200 --delay .02
+
+A DUT thread answers every command on a socket pair, after delay seconds, with some output and the prompt. The
+latency is the time between the DUT writing the prompt and the client matching it. The former loop is the one
+Client.expectphrase had before engine.protocols.Client.recv: recv_ready() polled every 9 ms, 1 KB per recv and 10 ms
+of sleep per iteration.
+"""
+import re
+import time
+import socket
+import select
+import argparse
+import threading
+import statistics
+from engine import utils
+from engine.protocols import Client
+
+PROMPT = 'dut# '
+
+
+class SocketChannel(object):
+    """The part of the paramiko channel the Client uses, on a socket."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.closed = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def recv_ready(self):
+        return bool(select.select([self.sock], [], [], 0)[0])
+
+    def recv(self, nbytes):
+        return self.sock.recv(nbytes)
+
+    def sendall(self, data):
+        self.sock.sendall(data.encode() if isinstance(data, str) else data)
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+
+
+def dut(sock, delay, output, sent):
+    """Answers every line with output and the prompt after delay seconds, records when the prompt was written."""
+    for _ in sock.makefile('rb'):
+        time.sleep(delay)
+        sock.sendall(output.encode())
+        sent.append(time.perf_counter())
+        sock.sendall(PROMPT.encode())
+
+
+def former_expect(client, expect):
+    """The receive loop of Client.expectphrase before Client.recv."""
+    time.sleep(.01)
+    response = ''
+    while not re.search(expect, response, re.DOTALL):
+        while not client.channel.recv_ready():
+            time.sleep(.009)
+        buffer = client.channel.recv(1024)
+        if len(buffer) == 0:
+            break
+        response += client.decoder.decode(buffer).replace('\r', '')
+        time.sleep(.01)
+    return 0
+
+
+def run(loop, prompts, delay, output):
+    """:return: (latencies in ms, CPU ms per prompt)"""
+    client_sock, dut_sock = socket.socketpair()
+    sent = []
+    threading.Thread(target=dut, args=(dut_sock, delay, output, sent), daemon=True).start()
+    client = Client('telnet', transport='native')
+    client.channel = SocketChannel(client_sock)
+    latencies = []
+    cpu = time.process_time()
+    for _ in range(prompts):
+        client.channel.sendall('show version\n')
+        if loop == 'former':
+            former_expect(client, PROMPT)
+        else:
+            client.expectphrase(PROMPT, timeout=10)
+        latencies.append((time.perf_counter() - sent[-1]) * 1000)
+    cpu = (time.process_time() - cpu) * 1000 / prompts
+    client.channel.close()
+    dut_sock.close()
+    return latencies, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--prompts', type=int, default=100)
+    parser.add_argument('--delay', type=float, default=.01, help='seconds the DUT takes to answer')
+    parser.add_argument('--output', type=int, default=2048, help='characters of output before the prompt')
+    args = parser.parse_args()
+
+    output = ''.join(f'line {i:05d} of the command output\n' for i in range(args.output // 32 + 1))[:args.output]
+    print(f'{"loop":<8}{"median ms":>10}{"p95 ms":>10}{"max ms":>10}{"CPU ms/prompt":>15}')
+    for loop in ('former', 'select'):
+        latencies, cpu = run(loop, args.prompts, args.delay, output)
+        p95 = statistics.quantiles(latencies, n=20)[-1]
+        print(f'{loop:<8}{statistics.median(latencies):>10.2f}{p95:>10.2f}{max(latencies):>10.2f}{cpu:>15.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Latency of cache_data, get_cached_data and get_many on the redis, shared and local backends.
+
+Usage, from the repository root:
+
+python -m benchmarks.store
+python -m benchmarks.store --ops 20000 --keys 1000 --size 1024 --port 6379
+
+Every operation goes through engine.utils, as a sequence calls it, on keys cycling over keys distinct keys of size
+characters values. get_many reads 10 keys at once. The redis backend uses the given Redis, or a fakeredis TCP server
+started when none is reachable, which is slower than redis-server. The shared backend maps a file in /dev/shm.
+"""
+import os
+import time
+import argparse
+import tempfile
+import statistics
+from engine import utils
+from engine import store
+from benchmarks import common
+
+BACKENDS = ('redis', 'shared', 'local')
+
+
+def measure(operation, ops):
+    """:return: list of the latencies of ops calls of operation(i), in us."""
+    latencies = []
+    for i in range(ops):
+        start = time.perf_counter()
+        operation(i)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies
+
+
+def run(backend, ops, keys, value, path):
+    """:return: {operation: latencies in us}"""
+    store.set_backend(backend, **({'path': path} if backend == 'shared' else {}))
+    utils.cache_many(dict((f'key{i}', value) for i in range(keys)))
+    operations = {'cache_data': lambda i: utils.cache_data(f'key{i % keys}', value),
+                  'get_cached_data': lambda i: utils.get_cached_data(f'key{i % keys}'),
+                  'get_many 10': lambda i: utils.get_many(f'key{(i + j) % keys}' for j in range(10))}
+    results = dict((name, measure(operation, ops)) for name, operation in operations.items())
+    store.get_store().sweep(common.GROUP)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    common.add_redis_arguments(parser)
+    parser.add_argument('--ops', type=int, default=5000, help='calls per operation')
+    parser.add_argument('--keys', type=int, default=100, help='distinct keys')
+    parser.add_argument('--size', type=int, default=64, help='characters per value')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    args = parser.parse_args()
+
+    host, port, description = common.redis_server(args)
+    common.use_redis(host, port)
+    common.set_slot(common.station(1)[0])
+    shm = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    path = os.path.join(shm, f'benchmark_store_{os.getpid()}')
+    print(f'{description}, {args.keys} keys of {args.size} characters, {args.ops} calls per operation')
+    print(f'{"backend":<8}{"operation":<17}{"median us":>10}{"p99 us":>10}{"ops/s":>10}')
+    try:
+        for backend in args.backends:
+            for operation, latencies in run(backend, args.ops, args.keys, 'x' * args.size, path).items():
+                p99 = statistics.quantiles(latencies, n=100)[-1]
+                print(f'{backend:<8}{operation:<17}{statistics.median(latencies):>10.1f}{p99:>10.1f}'
+                      f'{len(latencies) / sum(latencies) * 1e6:>10,.0f}')
+    finally:
+        os.remove(path) if os.path.exists(path) else None
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Follower latency and bytes pushed to Redis when a shared connection replicates a console capture.
+
+Usage, from the repository root:
+
+python -m benchmarks.streams
+python -m benchmarks.streams --sizes 1 4 --followers 3 --port 6379
+python -m benchmarks.streams --fake
+
+The master pushes a multi-MB boot console capture chunk by chunk, every interval seconds, as Client.expectphrase does
+with shared_conn=True. Follower threads read it back as the other containers of the sync group do. The latency is the
+time between the master pushing a chunk and a follower having it.
+
+streams is utils.stream_data/read_stream_data: one XADD per chunk, followers XREAD from their last entry. former is the
+replication before it: the master SET the whole response after every chunk, followers polled GET every 10 ms. The
+former one pushes the square of the capture size, so it only runs up to --former-max MB, its bytes are computed above.
+
+Without a reachable Redis, or with --fake, a fakeredis TCP server is started. It is much slower than redis-server, so
+only compare the two modes with each other there.
+"""
+import time
+import argparse
+import threading
+import statistics
+from engine import utils
+from benchmarks import common
+from benchmarks.expect import console
+
+
+def master(mode, sync_id, chunks, interval, pushed):
+    """Pushes chunks, appends the time each one was pushed to pushed."""
+    response = ''
+    for chunk in chunks:
+        pushed.append(time.perf_counter())
+        if mode == 'streams':
+            utils.stream_data(sync_id, chunk)
+        else:
+            response += chunk
+            utils.cache_data(sync_id, response)
+        time.sleep(interval)
+
+
+def follower(mode, sync_id, ends, received):
+    """Reads until it has every chunk, appends the time each one was received to received."""
+    last_id, response = '0', ''
+    while len(received) < len(ends):
+        if mode == 'streams':
+            for last_id, _ in utils.read_stream_data(sync_id, last_id):
+                received.append(time.perf_counter())
+        else:
+            response = utils.get_cached_data(sync_id) or response
+            now = time.perf_counter()
+            while len(received) < len(ends) and ends[len(received)] <= len(response):
+                received.append(now)
+            time.sleep(.01)
+
+
+def run(mode, text, chunk, interval, followers):
+    """:return: (latencies in ms of every chunk at every follower, wall time in s)"""
+    chunks = [text[i:i + chunk] for i in range(0, len(text), chunk)]
+    ends = [min(i + chunk, len(text)) for i in range(0, len(text), chunk)]
+    sync_id = f'bench-{mode}-{len(text)}-{time.time()}'
+    pushed, received = [], [[] for _ in range(followers)]
+    threads = [threading.Thread(target=follower, args=(mode, sync_id, ends, r), daemon=True) for r in received]
+    start = time.perf_counter()
+    [thread.start() for thread in threads]
+    master(mode, sync_id, chunks, interval, pushed)
+    [thread.join() for thread in threads]
+    latencies = [(t - p) * 1000 for r in received for t, p in zip(r, pushed)]
+    return latencies, time.perf_counter() - start
+
+
+def pushed_bytes(mode, size, chunk):
+    """Bytes the master sends to Redis, without the protocol overhead."""
+    if mode == 'streams':
+        return size
+    return sum(min(i + chunk, size) for i in range(0, size, chunk))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    common.add_redis_arguments(parser)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 4], help='MB of console capture')
+    parser.add_argument('--chunk', type=int, default=1024, help='characters per received chunk')
+    parser.add_argument('--interval', type=float, default=.001, help='seconds between two chunks')
+    parser.add_argument('--followers', type=int, default=3)
+    parser.add_argument('--former-max', type=float, default=.25, help='MB up to which the former one is run')
+    args = parser.parse_args()
+
+    host, port, description = common.redis_server(args)
+    common.use_redis(host, port)
+    slots = common.station(args.followers + 1)
+    common.set_slot(slots[0])
+    print(f'{description}, {args.followers} followers, {args.chunk} characters every {args.interval * 1000:g} ms')
+    print(f'{"MB":>6}  {"mode":<8}{"median ms":>10}{"p95 ms":>10}{"max ms":>10}{"wall s":>8}{"MB pushed":>12}')
+    for size in args.sizes:
+        text = console(int(size * 2 ** 20))
+        for mode in ('former', 'streams'):
+            mb = pushed_bytes(mode, len(text), args.chunk) / 2 ** 20
+            if mode == 'former' and size > args.former_max:
+                print(f'{size:>6g}  {mode:<8}{"-":>10}{"-":>10}{"-":>10}{"-":>8}{mb:>12.1f}')
+                continue
+            latencies, wall = run(mode, text, args.chunk, args.interval, args.followers)
+            p95 = statistics.quantiles(latencies, n=20)[-1]
+            print(f'{size:>6g}  {mode:<8}{statistics.median(latencies):>10.2f}{p95:>10.2f}{max(latencies):>10.2f}'
+                  f'{wall:>8.1f}{mb:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
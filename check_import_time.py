@@ -0,0 +1,52 @@
+"""Cold start guard: import lib must not pull in the heavy third party packages, they are imported on first use.
+
+Usage:
+
+python check_import_time.py
+python check_import_time.py --budget 150
+
+Runs python -X importtime -c "import lib" in a new interpreter, fails when one of HEAVY is imported and, with
+--budget, when the cumulative import time of lib is above budget milliseconds.
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+HEAVY = ('paramiko', 'redis', 'requests', 'robot')
+
+
+def import_times(module='lib'):
+    """:return dict: cumulative microseconds per module imported by import module, from -X importtime."""
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if process.returncode:
+        raise SystemExit(f'import {module} failed:\n{process.stderr}')
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='lib')
+    parser.add_argument('--budget', type=float, help='milliseconds the cumulative import may take')
+    args = parser.parse_args()
+
+    times = import_times(args.module)
+    heavy = sorted(name for name in times if name.split('.')[0] in HEAVY)
+    total = times.get(args.module, 0) / 1000
+    print(f'import {args.module}: {total:.1f} ms cumulative, {len(times)} modules')
+    if heavy:
+        raise SystemExit(f'import {args.module} imports {", ".join(heavy)}, import them on first use instead')
+    if args.budget is not None and total > args.budget:
+        raise SystemExit(f'import {args.module} took {total:.1f} ms, above the {args.budget:g} ms budget')
+
+
+if __name__ == '__main__':
+    main()
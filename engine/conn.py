@@ -1,5 +1,7 @@
 from engine import utils
 from engine import constants
+from engine import store
+from engine import logger as log
 from engine.protocols import Client
 
 CONTAINER = constants.CONTAINER
@@ -16,6 +18,14 @@ class StationConfiguration(object):
         return StationConfiguration(name)
 
     def add_connection(self, name, **kwargs):
+        """
+        :param name: connection name returned by lib.getconnections()
+        :param kwargs: engine.protocols.Client parameters
+
+        Example:
+            uut.add_connection('UUT', protocol='telnet', host='10.1.1.1', port=2003, transport='native')
+            uut.add_connection('CONSOLE', protocol='serial', port='/dev/ttyUSB0', baudrate=115200, transport='native')
+        """
         CONTAINER[self.container].update({name: kwargs})
 
     @staticmethod
@@ -25,6 +35,22 @@ class StationConfiguration(object):
                                          'timeout': timeout,
                                          'containers': containers}}) for container in containers]
 
+    @staticmethod
+    def set_log_level(level):
+        """
+        :param level: DEBUG, INFO, WARNING or ERROR, can be overridden per run with the ${log_level} variable.
+        """
+        log.set_level(level)
+
+    @staticmethod
+    def set_cache_backend(backend, **kwargs):
+        """
+        :param backend: cache_data backend, 'redis' (default), 'shared' (memory mapped file for single host stations)
+                        or 'local' (this process only).
+        :param kwargs: backend parameters, e.g. path='/dev/shm/iss_cache' for 'shared'.
+        """
+        store.set_backend(backend, **kwargs)
+
 
 def connection_protocol():
     return dict([(k, Client(**v)) for k, v in CONTAINER[utils.get_container_info().container].items()])
@@ -4,3 +4,5 @@ ABORT = 'ABORT'
 CONTAINER = {}
 SYNC_GROUPS = {}
 RUNTIME = {}
+POOL = {}
+CACHE_BACKEND = {}
@@ -4,6 +4,8 @@ from datetime import timedelta
 from timeit import default_timer as timer
 from engine import utils
 from engine import constants
+from engine import pool
+from engine import sync_groups
 from engine import logger as log
 
 
@@ -15,11 +17,17 @@ def test_suite():
 
 
 def final_test_suite():
-    pass
+    pool.close_all()
+    if utils.get_variable('${slot_location}') in constants.SYNC_GROUPS:
+        sync_groups.leave_sync_container()
+    log.flush(close=True)
 
 
 def test_case():
     RUNTIME['start_time'] = timer()
+    utils.snapshot_variables()
+    level = utils.get_variable('${log_level}')
+    log.set_level(level) if level else None
     log.message('-' * 100)
     log.message(f'SERIAL NUMBER:  {utils.get_variable("${serial_number}")}')
     log.message(f'FAMILY:         {utils.get_variable("${odc_family}").upper()}')
@@ -38,3 +46,9 @@ def final_test_case():
     log.message(f"END TIME: {datetime.utcnow().isoformat()[:-3]}")
     log.message(f"RUN TIME: {str(timedelta(seconds=timer() - RUNTIME['start_time']))[:-3]}")
     log.message('-'*100)
+    stats = utils.VARIABLE_STATS
+    log.debug('Robot variable lookups avoided by the snapshot: %s of %s', stats['hits'],
+              stats['hits'] + stats['lookups'])
+    stats.update(hits=0, lookups=0)
+    utils.invalidate_variables()
+    log.flush(close=True)
@@ -1,9 +1,129 @@
-# import random
-# from robot.libraries.BuiltIn import BuiltIn
-# from engine import conn
+import time
+import uuid
+import threading
+from engine import logger as log
+from engine import utils
 from engine import redis_lib
 
 RDB = redis_lib.RDB
 
-class ContainerLock():
-    return redis_lib.RDB
+
+class ContainerLock(object):
+    """FIFO lock with lease on a resource shared by the containers of a station, e.g. a hipot tester or a PDU.
+
+    Usage:
+
+    with ContainerLock('hipot'):
+        use the shared instrument, other containers queue until it is released
+
+    Each container queues a ticket and sleeps in BLPOP until the previous holder hands the lock over. Every ticket
+    has a lease key kept alive by its owner, by a background thread while the lock is held. A ticket whose lease
+    expired, because its container crashed or was killed, is dropped from the queue by the next container.
+    Wait and hold times are added up per container in the '<lock>::stats' hash.
+    """
+
+    def __init__(self, name, lease=30, timeout=600, cancel=None):
+        """
+        :param str name: name of the shared resource.
+        :param float lease: seconds a ticket stays valid without being renewed.
+        :param int timeout: seconds to wait for the lock before failing the test case.
+        :param threading.Event cancel: gives up waiting once set, the ticket leaves the queue and acquire raises.
+        """
+        self.name = name
+        self.key = f'lock::{name}'
+        self.lease = lease
+        self.timeout = timeout
+        self.cancel = cancel
+        self.slot = None
+        self.ticket = None
+        self.wait_time = 0.0
+        self.hold_time = 0.0
+        self._acquired_at = None
+        self._released = threading.Event()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def lease_key(self, ticket):
+        return f'{self.key}::lease::{ticket}'
+
+    def wake_key(self, ticket):
+        return f'{self.key}::wake::{ticket}'
+
+    def acquire(self):
+        self.slot = utils.get_variable('${slot_location}')
+        self.ticket = f'{self.slot}::{uuid.uuid4().hex}'
+        start = time.monotonic()
+        pipe = RDB.pipeline()
+        pipe.set(self.lease_key(self.ticket), 1, px=int(self.lease * 1000))
+        pipe.rpush(self.key, self.ticket)
+        pipe.execute()
+        while True:
+            pipe = RDB.pipeline()
+            pipe.set(self.lease_key(self.ticket), 1, px=int(self.lease * 1000))
+            pipe.lindex(self.key, 0)
+            pipe.lpos(self.key, self.ticket)
+            _, head, position = pipe.execute()
+            if head == self.ticket:
+                break
+            if position is None:
+                RDB.rpush(self.key, self.ticket)
+            elif head and not RDB.exists(self.lease_key(head)):
+                log.warning('Lock %s: dropping the expired ticket %s', self.name, head)
+                self.handover(head)
+                continue
+            if self.cancel is not None and self.cancel.is_set():
+                self.handover(self.ticket)
+                raise Exception(f'Lock {self.name}: cancelled while waiting')
+            if time.monotonic() - start > self.timeout:
+                self.handover(self.ticket)
+                utils.fail(f'Timeout waiting for lock {self.name} ~ {utils.formatted_seconds(self.timeout)}')
+            RDB.blpop(self.wake_key(self.ticket), timeout=1 if self.cancel else max(1, int(self.lease / 3)))
+        self._acquired_at = time.monotonic()
+        self.wait_time = self._acquired_at - start
+        self._released.clear()
+        threading.Thread(target=self.keep_alive, name=f'{self.key}::lease', daemon=True).start()
+        log.info('Lock %s: acquired after %.3f s', self.name, self.wait_time)
+
+    def keep_alive(self):
+        """Renews the lease of the ticket until the lock is released."""
+        while not self._released.wait(self.lease / 3):
+            RDB.pexpire(self.lease_key(self.ticket), int(self.lease * 1000))
+
+    def release(self):
+        if self._acquired_at is None:
+            return
+        self._released.set()
+        self.hold_time = time.monotonic() - self._acquired_at
+        self._acquired_at = None
+        self.handover(self.ticket)
+        pipe = RDB.pipeline()
+        pipe.hincrbyfloat(f'{self.key}::stats', f'{self.slot}::wait', self.wait_time)
+        pipe.hincrbyfloat(f'{self.key}::stats', f'{self.slot}::hold', self.hold_time)
+        pipe.hincrby(f'{self.key}::stats', f'{self.slot}::count', 1)
+        pipe.execute()
+        log.info('Lock %s: released after %.3f s', self.name, self.hold_time)
+
+    def handover(self, ticket):
+        """Removes ticket from the queue and wakes up the container next in line."""
+        pipe = RDB.pipeline()
+        pipe.lrem(self.key, 1, ticket)
+        pipe.delete(self.lease_key(ticket))
+        pipe.lindex(self.key, 0)
+        head = pipe.execute()[2]
+        if head:
+            RDB.pipeline().rpush(self.wake_key(head), 1).pexpire(self.wake_key(head), int(self.lease * 1000)).execute()
+
+    def stats(self):
+        """
+        :return dict: {container: {'wait': seconds, 'hold': seconds, 'count': times}} for this lock.
+        """
+        stats = {}
+        for field, value in RDB.hgetall(f'{self.key}::stats').items():
+            slot, name = field.rsplit('::', 1)
+            stats.setdefault(slot, {})[name] = float(value)
+        return stats
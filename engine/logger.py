@@ -1,41 +1,75 @@
-import os
+import logging
 from datetime import datetime
 from engine import utils
+from engine import writer
+
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {'DEBUG': DEBUG, 'INFO': INFO, 'WARNING': WARNING, 'ERROR': ERROR}
+_level = DEBUG
+
+
+def set_level(level):
+    """Sets the minimum level written to the log files, messages below it are dropped before being formatted.
+
+    The level also applies to the instrument drivers logging through the standard logging module.
+
+    :param (str | int) level: DEBUG, INFO, WARNING or ERROR
+    """
+    global _level
+    _level = LEVELS[level.upper()] if isinstance(level, str) else int(level)
+    logging.getLogger('hipot').setLevel(_level)
+
+
+def get_level():
+    return _level
+
+
+def is_enabled(level):
+    return level >= _level
 
 
 def message(msg):
     raw_path = utils.get_variable("${Raw_logs_path}")
     test_name = utils.get_variable("${TEST NAME}")
-    os.makedirs(f'{raw_path}') if not os.path.isdir(f'{raw_path}') else None
     for i in [test_name, 'sequences_logs']:
-        with open(f'{raw_path}/{i}.txt', 'a+', encoding="utf-8") as f:
-            f.write(f'{msg}\r')
+        writer.write(f'{raw_path}/{i}.txt', f'{msg}\r')
 
 
 def timestamp_log(msg):
     raw_path = utils.get_variable("${Raw_logs_path}")
     test_name = utils.get_variable("${TEST NAME}")
     test_mode = utils.get_variable('${test_mode}')
-    os.makedirs(f'{raw_path}') if not os.path.isdir(f'{raw_path}') else None
-    for i in [test_name, 'sequences_logs']:
-        with open(f'{raw_path}/{i}.txt', 'a+', encoding="utf-8") as f:
-            if i == 'sequences_logs':
-                f.write(f'[{datetime.now().isoformat()[:-3]}]|{test_mode}|{test_name}|: {msg}\r')
-            else:
-                f.write(f'[{datetime.now().isoformat()[:-3]}]: {msg}\r')
+    timestamp = datetime.now().isoformat()[:-3]
+    writer.write(f'{raw_path}/{test_name}.txt', f'[{timestamp}]: {msg}\r')
+    writer.write(f'{raw_path}/sequences_logs.txt', f'[{timestamp}]|{test_mode}|{test_name}|: {msg}\r')
+
+
+def flush(close=False):
+    """Blocks until every line logged so far is written to the log files."""
+    writer.flush(close=close)
 
 
-def info(msg):
-    timestamp_log(msg=f'{"INFO":<8}: {msg}')
+def info(msg, *args):
+    if _level > INFO:
+        return
+    timestamp_log(msg=f'{"INFO":<8}: {msg % args if args else msg}')
 
 
-def debug(msg):
-    timestamp_log(msg=f'{"DEBUG":<8}: {msg}')
+def debug(msg, *args):
+    if _level > DEBUG:
+        return
+    timestamp_log(msg=f'{"DEBUG":<8}: {msg % args if args else msg}')
 
 
-def warning(msg):
-    timestamp_log(msg=f'{"WARNING":<8}: {msg}')
+def warning(msg, *args):
+    if _level > WARNING:
+        return
+    timestamp_log(msg=f'{"WARNING":<8}: {msg % args if args else msg}')
 
 
-def error(msg):
-    timestamp_log(msg=f'{"ERROR":<8}: {msg}')
+def error(msg, *args):
+    timestamp_log(msg=f'{"ERROR":<8}: {msg % args if args else msg}')
@@ -0,0 +1,50 @@
+import time
+from engine import constants
+from engine import logger as log
+
+
+POOL = constants.POOL
+
+
+def pool_key(connection):
+    return connection.protocol, connection.host, connection.port
+
+
+def acquire(connection, prompt=None, idle=10, probe_timeout=2):
+    """Return an open session for the (protocol, host, port) of connection.
+
+    The session is kept open across calls and test cases. When it has been idle for more than idle seconds, it is
+    health-checked by sending a carriage return and waiting for prompt; a session that does not answer is closed
+    and reopened transparently.
+
+    :param connection: engine.protocols.Client created in the station config.
+    :param prompt: prompt expected after a carriage return, local_prompt of the connection by default.
+    :param idle: seconds after which an idle session is probed before being reused.
+    :param probe_timeout: seconds to wait for the prompt when probing.
+    :return: the pooled engine.protocols.Client
+    """
+    key = pool_key(connection)
+    client = POOL.get(key)
+    if client is not None:
+        prompt = prompt if prompt else client.local_prompt
+        if time.monotonic() - client.last_used <= idle or client.probe('\r', prompt, timeout=probe_timeout) >= 0:
+            client.last_used = time.monotonic()
+            return client
+        log.warning(f'Pooled connection {key} is not responding, reconnecting')
+        client.close()
+    connection.open()
+    connection.last_used = time.monotonic()
+    POOL[key] = connection
+    return connection
+
+
+def release(connection):
+    """Close and forget the pooled session of connection."""
+    client = POOL.pop(pool_key(connection), None)
+    client.close() if client else None
+
+
+def close_all():
+    for client in list(POOL.values()):
+        client.close()
+    POOL.clear()
@@ -2,19 +2,21 @@ import os
 import re
 import time
 import sys
+import select
 import getpass
-import paramiko
 import codecs
 import hashlib
-import multiprocessing as mp
 from engine import utils
 from engine import conn
 from engine import redis_lib
+from engine import transports
+from engine import writer
 from engine import sync_groups as sync
 from engine import logger as log
 
 
 RDB = redis_lib.RDB
+STREAM_IDS = {}
 
 
 def strip_ansi_codes(s):
@@ -22,17 +24,14 @@ def strip_ansi_codes(s):
 
 
 def write_to_file(path, msg):
-    os.makedirs(f'{path}') if not os.path.isdir(f'{path}') else None
     for i in [utils.get_variable("${TEST NAME}"), 'buffer_logs']:
-        with open(f'{path}/{i}.raw', 'a+', encoding="utf-8") as f:
-            f.write(msg)
+        writer.write(f'{path}/{i}.raw', msg)
 
 
 def save_log(msg, shared):
     if shared:
         for path in RDB.hvals(sync.get_sync_container_name()):
-            process = mp.Process(target=write_to_file, args=(path, msg))
-            process.start()
+            write_to_file(path, msg)
     else:
         write_to_file(utils.get_variable('${Raw_logs_path}'), msg)
 
@@ -41,11 +40,158 @@ def get_master_container():
     return utils.get_variable('${slot_location}') == sync.get_running_sync_containers()[0]
 
 
+try:
+    from re import _parser as sre_parse, _compiler as sre_compile, _constants as sre_constants
+except ImportError:
+    import sre_parse, sre_compile, sre_constants
+
+BEGIN_ANCHORS = (sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING)
+UNSAFE_OPCODES = (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS, sre_constants.ASSERT,
+                  sre_constants.ASSERT_NOT)
+
+
+def anchored(items):
+    """True if items hold a start anchor, a back reference or a look around, anywhere in their groups."""
+    for op, av in items:
+        if op in UNSAFE_OPCODES or op == sre_constants.AT and av in BEGIN_ANCHORS:
+            return True
+        for value in av if isinstance(av, (tuple, list)) else [av]:
+            if isinstance(value, sre_parse.SubPattern) and anchored(value):
+                return True
+            if isinstance(value, list) and value and isinstance(value[0], sre_parse.SubPattern) and \
+                    any(anchored(branch) for branch in value):
+                return True
+    return False
+
+
+def unbounded_gate(parsed):
+    r"""Returns (regex, width) matching the end of every match of parsed, None when there is no such bounded end.
+
+    The gate is the bounded tail of the pattern, e.g. r'\]#' for r'\[root@.*\]#', or one iteration of a final
+    repetition, e.g. r'\s$' for r'\$\s+$'. A final repetition that may be empty is left out, r'foo.*' matches
+    as soon as r'foo' does. A new match ends in the new data, so its gate is found in the new data and the width
+    characters before it, one more than needed for the context of \b.
+    """
+    items = list(parsed)
+    while items and items[-1][0] in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and items[-1][1][0] == 0:
+        items.pop()
+    gate = []
+    while items and not anchored(items[-1:]) and \
+            sre_parse.SubPattern(parsed.state, items[-1:]).getwidth()[1] < sre_constants.MAXREPEAT:
+        gate.insert(0, items.pop())
+    if items and items[-1][0] in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and \
+            sre_parse.SubPattern(parsed.state, gate).getwidth()[0] == 0:
+        low, _, body = items[-1][1]
+        body = sre_parse.SubPattern(parsed.state, list(body))
+        if low > 0 and not anchored(list(body)) and body.getwidth()[1] < sre_constants.MAXREPEAT:
+            gate = list(body) + gate
+    gate = sre_parse.SubPattern(parsed.state, gate)
+    if gate.getwidth()[0] == 0:
+        return None
+    try:
+        return sre_compile.compile(gate, parsed.state.flags), gate.getwidth()[1]
+    except Exception:
+        return None
+
+
+class ExpectMatcher(object):
+    r"""Incremental matcher for expect phrases.
+
+    Patterns are compiled once and every received chunk is scanned together with a bounded tail of the previous
+    data only, so the cost per chunk does not grow with the size of the response. The tail covers the longest match
+    of every bounded regular expression.
+
+    A regular expression with an unbounded repetition (*, +, {n,}), a start anchor (^, \A), a back reference or a
+    look around can match more than any tail. It is searched in the whole response, but only once the new data holds
+    the bounded end of the pattern, see unbounded_gate, e.g. ']#' for r'\[root@.*\]#'. The cost per chunk stays
+    flat while that end is rare in the data. It grows with the response when the end is frequent, e.g. r'\s$' for
+    r'\$\s+$' matches every chunk ending on a blank, or when there is no bounded end, e.g. r'(\w+) \1'. See
+    benchmarks/expect.py.
+
+    :param expect: expect phrase or list of expect phrases, plain text or regular expression.
+    :param int overlap: number of characters of previous data kept to match phrases spanning two chunks, 4096 or
+                        the longest phrase by default. Given, every phrase is only searched in that tail and the
+                        current chunk, e.g. r'Booting.*login:' no longer matches a boot log longer than overlap.
+    """
+
+    def __init__(self, expect, overlap=None):
+        if isinstance(expect, str):
+            expect = [expect] if len(expect) != 0 else []
+        self.expect = list(expect)
+        self.patterns = []
+        self.gates = []
+        widths = [overlap if overlap is not None else 4096] + [len(s) for s in self.expect]
+        for s in self.expect:
+            try:
+                self.patterns.append(re.compile(s, re.DOTALL))
+                parsed = sre_parse.parse(s, re.DOTALL)
+            except re.error:
+                self.patterns.append(None)
+                self.gates.append(None)
+                continue
+            width = parsed.getwidth()[1]
+            if overlap is not None or width < sre_constants.MAXREPEAT and not anchored(list(parsed)):
+                self.gates.append(None)
+                widths.append(width if overlap is None else 0)
+            else:
+                gate = unbounded_gate(parsed)
+                self.gates.append(gate if gate else (None, 0))
+                widths.append(gate[1] + 1 if gate else 0)
+        self.overlap = max(widths)
+        self.index = -1
+        self.last_match = None
+        self._chunks = []
+        self._size = 0
+        self._tail = ''
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def response(self):
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ''
+
+    @property
+    def recbuf(self):
+        recbuf = self.response
+        if self.index < 0:
+            return recbuf
+        if self.patterns[self.index]:
+            return re.sub(fr'{self.last_match}$', '', recbuf)
+        return recbuf[:-len(self.last_match)] if recbuf.endswith(self.last_match) else recbuf
+
+    def feed(self, data):
+        """Append new data and return the index of the first matching phrase, -1 if none matched yet."""
+        self._chunks.append(data)
+        self._size += len(data)
+        if self.index >= 0 or not self.expect:
+            return self.index
+        window = self._tail + data
+        for i, (s, p, gate) in enumerate(zip(self.expect, self.patterns, self.gates)):
+            if s in window or p and self.search(p, gate, window, data):
+                self.index = i
+                self.last_match = s
+                break
+        self._tail = window[-self.overlap:]
+        return self.index
+
+    def search(self, pattern, gate, window, data):
+        if gate is None:
+            return pattern.search(window)
+        regex, width = gate
+        if regex and not regex.search(window[-(len(data) + width + 1):]):
+            return None
+        return pattern.search(self.response)
+
+
 class Client(object):
     def __init__(self, protocol, host=None, shared_conn=False, user=None, password=None, timeout=30, port=None,
                  baudrate=9600, bytesize=8, stopbits=1, local_prompt=None, encoding='ISO-8859-1',
-                 display=False, *args, **kwargs):
+                 display=False, transport='shell', *args, **kwargs):
         self.protocol = protocol.lower()
+        self.transport = transport.lower()
         self.shared_conn = shared_conn
         self.host = host
         self.user = user
@@ -58,10 +204,11 @@ class Client(object):
         self.local_prompt = local_prompt if local_prompt else user
         self.display = display
         self.decoder = codecs.getincrementaldecoder(encoding)()
-        self.client = paramiko.SSHClient()
+        self.client = None
         self.channel = None
         self.last_match = None
         self.recbuf = None
+        self.opened_at = None
         self.sync_id = '6adf97f83acf6453d4a6a4b1070f3754'
         self.__dict__.update(kwargs)
 
@@ -76,10 +223,22 @@ class Client(object):
         self.close()
 
     def open(self):
-        self.client.load_system_host_keys()
-        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         if self.protocol not in ['ssh', 'telnet', 'serial']:
             utils.fail(f'No config protocol {self.protocol}, Please config protocol ["telnet", "serial", "ssh"]')
+        if self.transport not in ['shell', 'native']:
+            utils.fail(f'No config transport {self.transport}, Please config transport ["shell", "native"]')
+
+        self.opened_at = time.time()
+        if self.protocol in ['telnet', 'serial'] and self.transport == 'native':
+            if not self.shared_conn or self.shared_conn and get_master_container():
+                self.open_native()
+            self.display = True
+            return
+
+        import paramiko
+        self.client = paramiko.SSHClient()
+        self.client.load_system_host_keys()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
         if self.protocol == 'ssh':
             os.system(f'ssh-keygen -R {self.host}')
@@ -120,10 +279,24 @@ class Client(object):
                     self.expectphrase('Connected.', timeout=self.timeout)
         self.display = True
 
+    def open_native(self):
+        """Connect straight to the telnet server or the serial tty, without the ssh hop to the local shell."""
+        if self.protocol == 'telnet':
+            self.channel = transports.TelnetChannel(self.host, self.port if self.port else 23, timeout=self.timeout)
+            if self.user:
+                self.expectphrase(r'[Ll]ogin:', timeout=self.timeout)
+                self.channel.sendall(f'{self.user}\r')
+                self.expectphrase(r'[Pp]assword:', timeout=self.timeout)
+                self.channel.sendall(f'{self.password}\r')
+                self.expectphrase(self.local_prompt, timeout=self.timeout)
+        else:
+            self.channel = transports.SerialChannel(self.port, baudrate=self.baudrate, bytesize=self.bytesize,
+                                                    stopbits=self.stopbits)
+
     def send(self, command, expectphrase='', timeout=30, wait_before_send=None, check_received_string=None,
              check_not_received_string=None, strip_ansi=True, retry=1):
         if wait_before_send:
-            log.info(f'Wait Before Send: {wait_before_send} second')
+            log.info('Wait Before Send: %s second', wait_before_send)
             time.sleep(wait_before_send)
         timeout = timeout if timeout else self.timeout
         _cmd = command.replace('\n', '\\n').replace('\r', '')
@@ -134,16 +307,11 @@ class Client(object):
         for i in range(1, retry+1):
             status = []
             status.append(True) if not (check_received_string and check_not_received_string) else None
-            log.info(f"Send: '{_cmd}' | Expect Phrase: '{_expect}' | Timeout: {timeout}")
+            log.info("Send: '%s' | Expect Phrase: '%s' | Timeout: %s", _cmd, _expect, timeout)
             self.sync_id = hashlib.md5(f'{command}|{i}'.encode()).hexdigest()
-            log.info(f'Shared Connection ID: {self.sync_id}') if self.shared_conn else None
+            log.info('Shared Connection ID: %s', self.sync_id) if self.shared_conn else None
             if not self.shared_conn or self.shared_conn and get_master_container():
-                utils.delete_cached_data(self.sync_id) if self.shared_conn else None
-                while not self.channel.send_ready():
-                    time.sleep(.009)
-                self.channel.send(command)
-            else:
-                time.sleep(3)
+                self.channel.sendall(command)
             self.expectphrase(expectphrase, timeout=timeout, strip_ansi=strip_ansi) if expectphrase else None
             if check_received_string:
                 status.append(self.check_received_string(check_received_string))
@@ -151,20 +319,22 @@ class Client(object):
                 status.append(self.check_not_received_string(check_not_received_string))
             if all(status):
                 return True
-            log.warning(f"Try sending the command '{_cmd}' for the {i}th time.") if i != retry else None
+            log.warning("Try sending the command '%s' for the %sth time.", _cmd, i) if i != retry else None
         utils.fail()
 
-    def expectphrase(self, expect='', timeout=None, strip_ansi=True):
-        if isinstance(expect, str) and len(expect) != 0:
-            expect = [expect]
-        time.sleep(.01)
-        response = ''
-        with utils.Timeout(timeout if timeout else self.timeout, f'Timeout Expect Phrase'):
-            while len(expect) == 0 or not [s for s in expect if s in response or re.search(s, response, re.DOTALL)]:
+    def expectphrase(self, expect='', timeout=None, strip_ansi=True, overlap=None):
+        """Waits for expect, see ExpectMatcher for overlap.
+
+        :return: the index of the matched phrase, -1 when the channel closed first.
+        """
+        matcher = ExpectMatcher(expect, overlap)
+        with utils.Timeout(timeout if timeout else self.timeout, f'Timeout Expect Phrase') as scope:
+            while matcher.index < 0:
+                scope.check()
                 if not self.shared_conn or self.shared_conn and get_master_container():
-                    while not self.channel.recv_ready():
-                        time.sleep(.009)
-                    buffer = self.channel.recv(1024)
+                    buffer = self.recv(scope.remaining)
+                    if buffer is None:
+                        continue
                     if len(buffer) == 0:
                         break
                     buffer_decoded = self.decoder.decode(buffer).replace('\r', '')
@@ -173,25 +343,62 @@ class Client(object):
                         sys.stdout.write(buffer_decoded)
                         sys.stdout.flush()
                         save_log(buffer_decoded, shared=self.shared_conn)
-                    response += buffer_decoded
-                    utils.cache_data(self.sync_id, response) if self.shared_conn else None
+                    matcher.feed(buffer_decoded)
+                    utils.stream_data(self.sync_id, buffer_decoded) if self.shared_conn else None
                 else:
-                    get_cached = utils.get_cached_data(self.sync_id)
-                    response = get_cached if get_cached else ''
-                time.sleep(.01)
-        found_pattern = ''
-        if len(expect) != 0:
-            found_pattern = [(i, s) for i, s in enumerate(expect) if s in response or re.search(s, response, re.DOTALL)]
-        self.recbuf = response
-        if len(expect) != 0 and len(found_pattern) != 0:
-            self.recbuf = re.sub(fr'{found_pattern[0][1]}$', '', self.recbuf)
-            self.last_match = found_pattern[0][1]
-            return found_pattern[0][0]
-        return -1
+                    last_id = STREAM_IDS.get(self.sync_id, '0')
+                    for entry_id, data in utils.read_stream_data(self.sync_id, last_id, min(.1, scope.remaining)):
+                        STREAM_IDS[self.sync_id] = entry_id
+                        if matcher.feed(data) >= 0:
+                            break
+        self.recbuf = matcher.recbuf
+        if matcher.index >= 0:
+            self.last_match = matcher.last_match
+        return matcher.index
+
+    def probe(self, command, expect, timeout=2):
+        """Send command and wait for expect without failing the test case.
+
+        :return: the index of the matched phrase, -1 on timeout or when the channel is not usable.
+        """
+        if self.channel is None or self.channel.closed:
+            return -1
+        matcher = ExpectMatcher(expect)
+        deadline = time.monotonic() + timeout
+        try:
+            self.channel.sendall(command)
+            while matcher.index < 0 and time.monotonic() < deadline:
+                buffer = self.recv(max(0, deadline - time.monotonic()))
+                if buffer is None:
+                    continue
+                if len(buffer) == 0:
+                    break
+                matcher.feed(self.decoder.decode(buffer).replace('\r', ''))
+        except Exception:
+            return -1
+        self.recbuf = matcher.recbuf
+        return matcher.index
+
+    def recv(self, timeout=None, bufsize=65536):
+        """Wait until the channel is readable and drain every byte already available.
+
+        :return: the received bytes, b'' when the channel is closed or None if nothing arrived within timeout.
+        """
+        readable, _, _ = select.select([self.channel], [], [], timeout)
+        if not readable:
+            return None
+        buffer = self.channel.recv(bufsize)
+        while buffer and self.channel.recv_ready():
+            chunk = self.channel.recv(bufsize)
+            if not chunk:
+                break
+            buffer += chunk
+        return buffer
 
     def close(self):
         try:
-            self.client.close()
+            self.channel.close() if self.channel else None
+            self.client.close() if self.client else None
         except:
             pass
 
@@ -205,7 +412,7 @@ class Client(object):
             if not s:
                 s = re.search(i, self.recbuf)
                 s = s.group(0) if s else ''
-            log.debug(f"Check Received String: Expect: '{i}', Actual: '{s}' ---> {'PASS' if s else 'FAIL'}")
+            log.debug("Check Received String: Expect: '%s', Actual: '%s' ---> %s", i, s, 'PASS' if s else 'FAIL')
             results.append(bool(s))
         return all(results)
 
@@ -219,6 +426,7 @@ class Client(object):
             if not s:
                 s = re.search(i, self.recbuf)
                 s = s.group(0) if s else ''
-            log.debug(f"Check Not Received String: Dis Not Expect: '{i}', Actual: '{s}' ---> {'FAIL' if s else 'PASS'}")
+            log.debug("Check Not Received String: Dis Not Expect: '%s', Actual: '%s' ---> %s", i, s,
+                      'FAIL' if s else 'PASS')
             results.append(not bool(s))
         return all(results)
@@ -1,11 +1,11 @@
 import time
-import requests
 import json
 from engine import utils
 from engine import logger as log
 
 
 def ask_questions(question, picture_path, html, timeout=60):
+    import requests
     url = 'http://localhost:8080/api/user_interaction'
     slot = utils.get_variable("${slot_location}")
     data = {'slot_location_no': slot,
@@ -18,9 +18,11 @@ def ask_questions(question, picture_path, html, timeout=60):
               'Data-Type': 'application/json'}
     log.warning(question)
     requests.post(url, data=json.dumps(data), headers=header)
-    with utils.Timeout(timeout, 'The users do not answer questions within'):
+    with utils.Timeout(timeout, 'The users do not answer questions within') as scope:
         while True:
-            response = requests.get(url, params={'slot_location_no': slot}, headers=header).json()
+            scope.check()
+            response = requests.get(url, params={'slot_location_no': slot}, headers=header,
+                                    timeout=max(1, scope.remaining)).json()
             response = response.get("data")
             if isinstance(response, dict):
                 status = response.get("answer")
@@ -28,4 +30,4 @@ def ask_questions(question, picture_path, html, timeout=60):
                 log.error(reason) if '-' != reason else None
                 if status:
                     return status
-            time.sleep(1)
+            time.sleep(min(1, scope.remaining))
@@ -1,7 +1,69 @@
-import redis
+import math
 
-RDB = redis.StrictRedis(host='localhost',
-                        port=6379,
-                        db=0,
-                        charset="utf-8",
-                        decode_responses=True)
+
+class LazyRedis(object):
+    """Redis client created on first use, so importing the libraries neither imports redis nor opens a connection."""
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._client = None
+
+    def __getattr__(self, name):
+        if self._client is None:
+            import redis
+            self._client = redis.StrictRedis(**self._kwargs)
+        return getattr(self._client, name)
+
+
+RDB = LazyRedis(host='localhost',
+                port=6379,
+                db=0,
+                charset="utf-8",
+                decode_responses=True)
+
+
+def index_key(namespace):
+    return f"{namespace}::keys"
+
+
+class RedisStore(object):
+    """cache_data backend on the station Redis, shared by every container.
+
+    Keys are written as '<namespace>|<key>' and recorded in the index set of the namespace in the same pipeline. The
+    ttl is set in milliseconds with PEXPIRE, so that a float ttl behaves as on the other backends.
+    """
+
+    def __init__(self, client=None):
+        self.client = client if client else RDB
+
+    def get(self, namespace, key):
+        return self.client.get(f"{namespace}|{key}")
+
+    def get_many(self, namespace, keys):
+        return self.client.mget([f"{namespace}|{key}" for key in keys]) if keys else []
+
+    def set(self, namespace, key, value, ttl=None):
+        self.set_many(namespace, {key: value}, ttl=ttl)
+
+    def set_many(self, namespace, mapping, ttl=None):
+        if not mapping:
+            return
+        mapping = dict((f"{namespace}|{key}", value) for key, value in mapping.items())
+        pipe = self.client.pipeline()
+        pipe.mset(mapping)
+        [pipe.pexpire(key, math.ceil(ttl * 1000)) for key in mapping] if ttl else None
+        pipe.sadd(index_key(namespace), *mapping)
+        pipe.execute()
+
+    def delete(self, namespace, key):
+        self.delete_many(namespace, [key])
+
+    def delete_many(self, namespace, keys):
+        if not keys:
+            return
+        keys = [f"{namespace}|{key}" for key in keys]
+        self.client.pipeline().delete(*keys).srem(index_key(namespace), *keys).execute()
+
+    def sweep(self, namespace):
+        """Deletes every key recorded in the index of namespace, and the index."""
+        self.client.delete(index_key(namespace), *self.client.smembers(index_key(namespace)))
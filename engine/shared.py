@@ -0,0 +1,104 @@
+import os
+import time
+import mmap
+import fcntl
+import struct
+import pickle
+import contextlib
+
+
+class SharedMemoryStore(object):
+    """cache_data backend in a memory mapped file, shared by the containers of a single host through /dev/shm.
+
+    The file holds a header (version, length) followed by the pickled {(namespace, key): (value, expires)} data.
+    Readers keep the last data they unpickled and only read it again when the version changed. Access is serialized
+    with flock. Expired keys are dropped on the next write.
+    """
+
+    HEADER = struct.Struct('<QQ')
+
+    def __init__(self, path='/dev/shm/iss_cache', size=1 << 20):
+        """
+        :param str path: file backing the store, it must be on a path shared by the containers.
+        :param int size: initial size of the file in bytes, it grows when needed.
+        """
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        with self.locked(fcntl.LOCK_EX):
+            os.ftruncate(self.fd, size) if os.fstat(self.fd).st_size < size else None
+        self._map = mmap.mmap(self.fd, 0)
+        self._version = None
+        self._data = {}
+
+    @contextlib.contextmanager
+    def locked(self, operation):
+        fcntl.flock(self.fd, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _remap(self):
+        if os.fstat(self.fd).st_size != len(self._map):
+            self._map.close()
+            self._map = mmap.mmap(self.fd, 0)
+
+    def _load(self):
+        self._remap()
+        version, length = self.HEADER.unpack_from(self._map, 0)
+        if version != self._version:
+            self._data = pickle.loads(self._map[self.HEADER.size:self.HEADER.size + length]) if length else {}
+            self._version = version
+        return self._data
+
+    def _dump(self, data):
+        payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        end = self.HEADER.size + len(payload)
+        if end > len(self._map):
+            os.ftruncate(self.fd, max(end, 2 * len(self._map)))
+            self._remap()
+        self._map[self.HEADER.size:end] = payload
+        self._version += 1
+        self._data = data
+        self.HEADER.pack_into(self._map, 0, self._version, len(payload))
+
+    def get(self, namespace, key):
+        return self.get_many(namespace, [key])[0]
+
+    def get_many(self, namespace, keys):
+        now = time.time()
+        with self.locked(fcntl.LOCK_SH):
+            data = self._load()
+            items = [data.get((namespace, key), (None, None)) for key in keys]
+        return [value if expires is None or expires > now else None for value, expires in items]
+
+    def set(self, namespace, key, value, ttl=None):
+        self.set_many(namespace, {key: value}, ttl=ttl)
+
+    def set_many(self, namespace, mapping, ttl=None):
+        now = time.time()
+        expires = now + ttl if ttl else None
+        with self.locked(fcntl.LOCK_EX):
+            data = self._load()
+            for k in [k for k, (_, e) in data.items() if e is not None and e <= now]:
+                del data[k]
+            data.update(((namespace, key), (str(value), expires)) for key, value in mapping.items())
+            self._dump(data)
+
+    def delete(self, namespace, key):
+        self.delete_many(namespace, [key])
+
+    def delete_many(self, namespace, keys):
+        with self.locked(fcntl.LOCK_EX):
+            data = self._load()
+            if [data.pop((namespace, key), None) for key in keys if (namespace, key) in data]:
+                self._dump(data)
+
+    def sweep(self, namespace):
+        with self.locked(fcntl.LOCK_EX):
+            data = self._load()
+            self._dump(dict((k, v) for k, v in data.items() if k[0] != namespace))
+
+    def close(self):
+        self._map.close()
+        os.close(self.fd)
@@ -0,0 +1,64 @@
+import time
+import threading
+import importlib
+from engine import constants
+
+
+BACKENDS = {'redis': ('engine.redis_lib', 'RedisStore'),
+            'shared': ('engine.shared', 'SharedMemoryStore'),
+            'local': ('engine.store', 'LocalStore')}
+CACHE_BACKEND = constants.CACHE_BACKEND
+
+
+class LocalStore(object):
+    """cache_data backend keeping the data in this process only, for single container stations and unit tests."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        return self.get_many(namespace, [key])[0]
+
+    def get_many(self, namespace, keys):
+        now = time.time()
+        items = [self._data.get((namespace, key), (None, None)) for key in keys]
+        return [value if expires is None or expires > now else None for value, expires in items]
+
+    def set(self, namespace, key, value, ttl=None):
+        self.set_many(namespace, {key: value}, ttl=ttl)
+
+    def set_many(self, namespace, mapping, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data.update(((namespace, key), (str(value), expires)) for key, value in mapping.items())
+
+    def delete(self, namespace, key):
+        self.delete_many(namespace, [key])
+
+    def delete_many(self, namespace, keys):
+        with self._lock:
+            [self._data.pop((namespace, key), None) for key in keys]
+
+    def sweep(self, namespace):
+        with self._lock:
+            self._data = dict((k, v) for k, v in self._data.items() if k[0] != namespace)
+
+
+def set_backend(backend, **kwargs):
+    """Selects the cache_data backend: 'redis' (default), 'shared' or 'local'.
+
+    :param str backend: name of the backend.
+    :param kwargs: parameters of the backend class.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f'No cache backend {backend}, Please config backend {list(BACKENDS)}')
+    CACHE_BACKEND.clear()
+    CACHE_BACKEND.update(backend=backend, kwargs=kwargs)
+
+
+def get_store():
+    if 'store' not in CACHE_BACKEND:
+        module, name = BACKENDS[CACHE_BACKEND.get('backend', 'redis')]
+        CACHE_BACKEND['store'] = getattr(importlib.import_module(module), name)(**CACHE_BACKEND.get('kwargs', {}))
+    return CACHE_BACKEND['store']
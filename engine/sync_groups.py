@@ -1,10 +1,15 @@
 import os
 import re
+import math
 import time
+import base64
+import pickle
+import importlib
 from engine import logger as log
 from engine import utils
 from engine import conn
 from engine import redis_lib
+from engine import store
 
 
 RDB = redis_lib.RDB
@@ -15,37 +20,203 @@ class Structure:
         self.__dict__.update(entries)
 
 
-def sync_group(group_name, timeout=60):
+def sync_group(group_name, timeout=60, leader=None, **kwargs):
     sync = get_sync_container()
     group = f"{sync.name}::{group_name}"
     log.info(f"Sync Group Name      = {group}")
     log.info(f"Sync Containers List = {list(RDB.hkeys(sync.name))}")
-    RDB.sadd(group, utils.get_variable('${slot_location}'))
+    on_release = (lambda: leader_call(leader, kwargs)) if leader else None
     with utils.Timeout(timeout, 'Timeout Sync Group'):
-        while True:
-            if RDB.scard(group) <= 0 or RDB.scard(group) == len(RDB.hkeys(sync.name)):
-                break
-            time.sleep(.009)
-    RDB.delete(group)
-    return True
+        payload = barrier(group, utils.get_variable('${slot_location}'), running=sync.name, timeout=timeout,
+                          index=index_key(sync.name), on_release=on_release)
+    if not leader:
+        return True
+    status, result = loads(payload)
+    if status == 'error':
+        raise result
+    return result
+
+
+def sync_gather(group_name, value, timeout=60):
+    sync = get_sync_container()
+    group = f"{sync.name}::{group_name}"
+    log.info(f"Sync Gather Name     = {group}")
+    with utils.Timeout(timeout, 'Timeout Sync Gather'):
+        payload = barrier(group, utils.get_variable('${slot_location}'), running=sync.name, timeout=timeout,
+                          index=index_key(sync.name), data=dumps(value), on_release=lambda: gather(group))
+    return loads(payload)
+
+
+def gather(group):
+    """Reads and resets the data left at group by every container, returns it serialized as one mapping."""
+    pipe = RDB.pipeline()
+    pipe.hgetall(data_key(group))
+    pipe.delete(data_key(group))
+    data = pipe.execute()[0]
+    return dumps(dict((slot, loads(value)) for slot, value in data.items()))
+
+
+def dumps(obj):
+    return base64.b64encode(pickle.dumps(obj)).decode()
+
+
+def loads(payload):
+    return pickle.loads(base64.b64decode(payload))
+
+
+def leader_call(leader, kwargs):
+    """Runs the leader function and returns its result, or the exception it raised, serialized for the group.
+
+    A leader that cannot be imported or a result that cannot be pickled is delivered as the error, so that every member
+    raises it, the leader included, instead of the leader failing alone while the others wait for their release.
+
+    :param (str | callable) leader: function or 'package.module.function' path.
+    :param dict kwargs: parameters passed to the leader function.
+    """
+    name = leader if isinstance(leader, str) else f'{leader.__module__}.{leader.__name__}'
+    with utils.TimeIt() as t:
+        try:
+            if isinstance(leader, str):
+                module, function = leader.rsplit('.', 1)
+                leader = getattr(importlib.import_module(module), function)
+            payload = dumps(('result', leader(**kwargs)))
+        except Exception as e:
+            payload = error_payload(e)
+    log.info(f"Sync Leader Function = {name} ({t.duration:.3f} s)")
+    return payload
+
+
+def error_payload(e):
+    """Serializes the exception e, or a RuntimeError describing it when e itself cannot be pickled."""
+    try:
+        return dumps(('error', e))
+    except Exception:
+        return dumps(('error', RuntimeError(f'{type(e).__name__}: {e}')))
+
+
+def index_key(name):
+    return redis_lib.index_key(name)
+
+
+def data_key(group):
+    return f"{group}::data"
+
+
+def release_key(group, slot):
+    return f"{group}::release::{slot}"
+
+
+def barrier(group, slot, running=None, expected=None, timeout=60, wait=None, index=None, data=None,
+            on_release=None):
+    """Blocks until the containers expected at group have all arrived.
+
+    Arriving is one transaction adding slot to the group set. The last container to arrive takes the members out of
+    the set, runs on_release and releases the others by pushing its result to their own release list, where they
+    sleep in BLPOP meanwhile. The wait is sliced so that containers removed from the running hash by fail() are
+    taken into account, and the enclosing utils.Timeout is checked between the slices.
+
+    :param str group: Redis key of the set of containers arrived at the barrier.
+    :param str slot: this container.
+    :param str running: Redis hash of the running containers, its length is the number of containers expected.
+    :param int expected: number of containers expected, used when running is not given.
+    :param float timeout: seconds the release tokens are kept for containers that never collect them.
+    :param float wait: seconds to wait for the other containers, forever by default.
+    :param str index: Redis set recording the keys of the sync group, see delete_keys.
+    :param str data: stored for slot in the data hash of group when arriving, see gather.
+    :param on_release: function run by the releasing container only, returning the str delivered to every member.
+    :return: the str returned by on_release ('1' without it), None if wait expired first.
+    """
+    deadline = time.monotonic() + wait if wait else None
+    scope = utils.Timeout.current()
+    pipe = RDB.pipeline()
+    pipe.delete(release_key(group, slot))
+    pipe.sadd(group, slot)
+    pipe.sadd(index, group, release_key(group, slot)) if index else None
+    pipe.hset(data_key(group), slot, data) if data is not None else None
+    pipe.sadd(index, data_key(group)) if index and data is not None else None
+    arrived, total = arrivals(pipe, group, running, expected)
+    while True:
+        if arrived >= total:
+            pipe = RDB.pipeline()
+            pipe.smembers(group)
+            pipe.delete(group)
+            members = pipe.execute()[0]
+            if slot in members:
+                payload = on_release() if on_release else '1'
+                release(group, members - {slot}, payload, timeout=timeout)
+                return payload
+        if deadline and time.monotonic() >= deadline:
+            return None
+        scope.check() if scope else None
+        remaining = [1, scope.remaining if scope else 1, deadline - time.monotonic() if deadline else 1]
+        token = RDB.blpop(release_key(group, slot), timeout=max(.01, min(remaining)))
+        if token:
+            return token[1]
+        arrived, total = arrivals(RDB.pipeline(), group, running, expected)
+
+
+def arrivals(pipe, group, running=None, expected=None):
+    """Executes pipe with the count of containers arrived at group and the number expected appended."""
+    pipe.scard(group)
+    pipe.hlen(running) if running else None
+    results = pipe.execute()
+    return (results[-2], results[-1]) if running else (results[-1], expected)
+
+
+def release(group, members, payload='1', timeout=60):
+    """Pushes payload to the release list of every member waiting at group, kept timeout seconds, a float too."""
+    pipe = RDB.pipeline()
+    for member in members:
+        pipe.rpush(release_key(group, member), payload)
+        pipe.pexpire(release_key(group, member), math.ceil(timeout * 1000))
+    pipe.execute()
 
 
 def add_sync_containers():
     slot = utils.get_variable('${slot_location}')
     sync = get_sync_container()
     log.info(f"Sync Group Name      = {sync.name}")
-    [RDB.delete(key) for key in RDB.keys('*') if sync.name in key]
-    time.sleep(sync.timeout)
+    bring_up = f"{sync.name}::bring_up"
+    if RDB.set(bring_up, slot, nx=True, px=math.ceil(sync.timeout * 1000)):
+        delete_keys(sync.name)
+        pipe = RDB.pipeline()
+        for container in set(sync.containers) - {slot}:
+            pipe.rpush(f"{bring_up}::{container}", 1)
+            pipe.pexpire(f"{bring_up}::{container}", math.ceil(sync.timeout * 1000))
+        pipe.execute()
+    else:
+        RDB.blpop(f"{bring_up}::{slot}", timeout=sync.timeout)
     RDB.hset(sync.name, slot, utils.get_variable('${Raw_logs_path}'))
-    start_time = time.time()+sync.timeout
-    while time.time() <= start_time:
-        if len(RDB.hgetall(sync.name)) == len(sync.containers):
-            break
+    barrier(f"{sync.name}::join", slot, expected=len(sync.containers), timeout=sync.timeout, wait=sync.timeout,
+            index=index_key(sync.name))
+    RDB.delete(bring_up)
     log.info(f"Sync Containers List = {RDB.hkeys(sync.name)}")
     log.info(f"Sync Containers Path = {RDB.hvals(sync.name)}")
     log.info(f"Sync Group Time Out  = {sync.timeout}")
 
 
+def delete_keys(name):
+    """Deletes the running hash of the sync group and every key recorded in its index, in one call."""
+    RDB.delete(name, index_key(name), *RDB.smembers(index_key(name)))
+
+
+def leave_sync_container():
+    """Removes this container from the running hash, the last container to leave sweeps the keys of the group.
+
+    :return bool: True if the keys were swept.
+    """
+    name = get_sync_container_name()
+    pipe = RDB.pipeline()
+    pipe.hdel(name, utils.get_variable('${slot_location}'))
+    pipe.hlen(name)
+    if pipe.execute()[1]:
+        return False
+    delete_keys(name)
+    store.get_store().sweep(name)
+    log.info('Sync container %s: keys swept', name)
+    return True
+
+
 def get_sync_container():
     sync = conn.SYNC_GROUPS[utils.get_variable('${slot_location}')]
     return Structure(**sync)
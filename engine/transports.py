@@ -0,0 +1,155 @@
+import os
+import select
+import socket
+import termios
+
+
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+ECHO = 1
+SGA = 3
+
+
+class TelnetChannel(object):
+    """Direct telnet connection with the same interface used by Client on a paramiko channel.
+
+    Option negotiation is answered in place: the remote side may ECHO and suppress go-ahead, every other option is
+    refused. Sub-negotiations are discarded and escaped IAC bytes are delivered as data.
+    """
+
+    def __init__(self, host, port=23, timeout=30):
+        self.sock = socket.create_connection((host, int(port)), timeout=timeout)
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.closed = False
+        self._state = None
+        self._command = None
+        self._answered = set()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def recv_ready(self):
+        return bool(select.select([self.sock], [], [], 0)[0])
+
+    def recv(self, nbytes):
+        """Read from the socket and strip the telnet commands.
+
+        :return: data bytes, b'' when the connection is closed or None if only negotiation was received.
+        """
+        raw = self.sock.recv(nbytes)
+        if len(raw) == 0:
+            self.closed = True
+            return b''
+        data = self._process(raw)
+        return data if data else None
+
+    def _process(self, raw):
+        data = bytearray()
+        reply = bytearray()
+        for byte in raw:
+            if self._state is None:
+                if byte == IAC:
+                    self._state = IAC
+                else:
+                    data.append(byte)
+            elif self._state == IAC:
+                if byte == IAC:
+                    data.append(byte)
+                    self._state = None
+                elif byte in (DO, DONT, WILL, WONT):
+                    self._command = byte
+                    self._state = byte
+                elif byte == SB:
+                    self._state = SB
+                else:
+                    self._state = None
+            elif self._state == SB:
+                self._state = 'SB_IAC' if byte == IAC else SB
+            elif self._state == 'SB_IAC':
+                self._state = None if byte == SE else SB
+            else:
+                reply += self._negotiate(self._command, byte)
+                self._state = None
+        if reply:
+            self.sock.sendall(bytes(reply))
+        return bytes(data)
+
+    def _negotiate(self, command, option):
+        if command == WILL:
+            answer = DO if option in (ECHO, SGA) else DONT
+        elif command == DO:
+            answer = WILL if option == SGA else WONT
+        else:
+            return b''
+        if (answer, option) in self._answered:
+            return b''
+        self._answered.add((answer, option))
+        return bytes([IAC, answer, option])
+
+    def send(self, data):
+        self.sendall(data)
+        return len(data)
+
+    def sendall(self, data):
+        data = data.encode() if isinstance(data, str) else data
+        self.sock.sendall(data.replace(bytes([IAC]), bytes([IAC, IAC])))
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+
+
+class SerialChannel(object):
+    """Raw termios serial port with the same interface used by Client on a paramiko channel."""
+
+    def __init__(self, port, baudrate=9600, bytesize=8, stopbits=1):
+        self.fd = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        self.closed = False
+        try:
+            speed = getattr(termios, f'B{baudrate}')
+            iflag, oflag, cflag, lflag, ispeed, ospeed, cc = termios.tcgetattr(self.fd)
+            cflag = termios.CLOCAL | termios.CREAD | getattr(termios, f'CS{bytesize}')
+            cflag |= termios.CSTOPB if int(stopbits) == 2 else 0
+            cc[termios.VMIN] = 0
+            cc[termios.VTIME] = 0
+            termios.tcsetattr(self.fd, termios.TCSANOW, [0, 0, cflag, 0, speed, speed, cc])
+            termios.tcflush(self.fd, termios.TCIOFLUSH)
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def fileno(self):
+        return self.fd
+
+    def recv_ready(self):
+        return bool(select.select([self.fd], [], [], 0)[0])
+
+    def recv(self, nbytes):
+        try:
+            return os.read(self.fd, nbytes)
+        except BlockingIOError:
+            return None
+
+    def send(self, data):
+        self.sendall(data)
+        return len(data)
+
+    def sendall(self, data):
+        data = data.encode() if isinstance(data, str) else data
+        while data:
+            select.select([], [self.fd], [])
+            try:
+                data = data[os.write(self.fd, data):]
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            os.close(self.fd)
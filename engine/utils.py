@@ -1,16 +1,22 @@
 import time
-import signal
+import threading
 import traceback
-from robot.libraries.BuiltIn import BuiltIn
 from engine import logger as log
 from engine import conn
 from engine import redis_lib
+from engine import store
 from engine import sync_groups
 
 
 RDB = redis_lib.RDB
 
 
+def builtin():
+    """Returns the Robot BuiltIn library, robot is imported on first use only."""
+    from robot.libraries.BuiltIn import BuiltIn
+    return BuiltIn()
+
+
 class APDicts:
     userdict = {}
 
@@ -20,53 +26,113 @@ class Structure:
         self.__dict__.update(entries)
 
 
+SNAPSHOT_KEYS = ('${slot_location}', '${Raw_logs_path}', '${TEST NAME}', '${test_mode}', '${serial_number}',
+                 '${odc_family}', '${SUITE_NAME}', '${operation_id}', '${script_version}', '${log_level}')
+STREAM_TTL = 3600
+VARIABLES = {}
+VARIABLE_STATS = {'hits': 0, 'lookups': 0}
+
+
+def snapshot_variables(keys=SNAPSHOT_KEYS):
+    """Caches the given Robot variables, get_variable then returns them without going through BuiltIn."""
+    robot = builtin()
+    VARIABLES.update((key, robot.get_variable_value(key)) for key in keys)
+
+
+def invalidate_variables(*keys):
+    """Drops the given variables from the snapshot, all of them if no key is given.
+
+    Must be called after changing a snapshot variable, e.g. with Set Test Variable.
+    """
+    [VARIABLES.pop(key, None) for key in keys] if keys else VARIABLES.clear()
+
+
 def get_variable(key):
-    return BuiltIn().get_variable_value(key)
+    if key in VARIABLES:
+        VARIABLE_STATS['hits'] += 1
+        return VARIABLES[key]
+    VARIABLE_STATS['lookups'] += 1
+    return builtin().get_variable_value(key)
 
 
 def get_variables():
-    return BuiltIn().get_variables()
+    return builtin().get_variables()
 
 
 def get_container_info():
-    info = Structure(area=BuiltIn().get_variable_value('${SUITE_NAME}'),
-                     container=BuiltIn().get_variable_value('${slot_location}'),
+    info = Structure(area=get_variable('${SUITE_NAME}'),
+                     container=get_variable('${slot_location}'),
                      containers=list(conn.CONTAINER.keys()),
-                     odc_family=BuiltIn().get_variable_value('${odc_family}'),
-                     test_mode=BuiltIn().get_variable_value('${test_mode}'),
-                     serial_number=BuiltIn().get_variable_value('${serial_number}'),
-                     username=BuiltIn().get_variable_value('${operation_id}'))
+                     odc_family=get_variable('${odc_family}'),
+                     test_mode=get_variable('${test_mode}'),
+                     serial_number=get_variable('${serial_number}'),
+                     username=get_variable('${operation_id}'))
     return info
 
 
 def get_iss_mode():
-    return Structure(odc_family=BuiltIn().get_variable_value('${odc_family}'))
+    return Structure(odc_family=get_variable('${odc_family}'))
 
 
 def fail(msg=None):
-    msg = msg if msg else f"{BuiltIn().get_variable_value('${TEST NAME}')}: FAILED"
+    msg = msg if msg else f"{get_variable('${TEST NAME}')}: FAILED"
     log.error(msg)
+    log.flush()
     if conn.SYNC_GROUPS:
-        RDB.hdel(sync_groups.get_sync_container_name(), BuiltIn().get_variable_value('${slot_location}'))
-    BuiltIn().fail(msg=msg)
+        RDB.hdel(sync_groups.get_sync_container_name(), get_variable('${slot_location}'))
+    builtin().fail(msg=msg)
 
 
 def fatal_error(msg=None):
-    msg = msg if msg else f"{BuiltIn().get_variable_value('${TEST NAME}')}: FAILED"
+    msg = msg if msg else f"{get_variable('${TEST NAME}')}: FAILED"
     log.error(msg)
-    BuiltIn().fatal_error(msg=msg)
+    log.flush()
+    builtin().fatal_error(msg=msg)
+
 
+def cache_data(k, v, ttl=None):
+    store.get_store().set(sync_groups.get_sync_container_name(), k, v, ttl=ttl)
 
-def cache_data(k, v):
-    RDB.set(f"{sync_groups.get_sync_container_name()}|{k}", v)
+
+def cache_many(mapping, ttl=None):
+    store.get_store().set_many(sync_groups.get_sync_container_name(), mapping, ttl=ttl)
 
 
 def get_cached_data(k):
-    return RDB.get(f"{sync_groups.get_sync_container_name()}|{k}")
+    return store.get_store().get(sync_groups.get_sync_container_name(), k)
+
+
+def get_many(keys):
+    keys = list(keys)
+    return dict(zip(keys, store.get_store().get_many(sync_groups.get_sync_container_name(), keys)))
 
 
 def delete_cached_data(k):
-    RDB.delete(f"{sync_groups.get_sync_container_name()}|{k}")
+    store.get_store().delete(sync_groups.get_sync_container_name(), k)
+
+
+def delete_many(keys):
+    store.get_store().delete_many(sync_groups.get_sync_container_name(), list(keys))
+
+
+def stream_data(k, v):
+    """Appends v to the stream k of the sync container, the stream expires STREAM_TTL seconds after the last append."""
+    name = sync_groups.get_sync_container_name()
+    pipe = RDB.pipeline()
+    pipe.xadd(f"{name}|{k}", {'data': v})
+    pipe.expire(f"{name}|{k}", STREAM_TTL)
+    pipe.sadd(sync_groups.index_key(name), f"{name}|{k}")
+    pipe.execute()
+
+
+def read_stream_data(k, last_id='0', timeout=.1):
+    """Returns the data appended with stream_data after last_id, waiting up to timeout seconds for it.
+
+    :return: list of (entry_id, data) in the order they were appended.
+    """
+    k = f"{sync_groups.get_sync_container_name()}|{k}"
+    response = RDB.xread({k: last_id}, block=max(1, int(timeout * 1000)))
+    return [(entry_id, fields['data']) for entry_id, fields in response[0][1]] if response else []
 
 
 def formatted_seconds(seconds):
@@ -116,20 +182,29 @@ class TimeIt(object):
 
 
 class Timeout(object):
-    """Timeout class using Alarm signal
+    """Deadline scope checked cooperatively by the I/O loops.
 
     Usage:
 
-    with Timeout(3, 'do something within'):
-        do something within 0:03:00, otherwise, failed
+    with Timeout(3, 'do something within') as timeout:
+        while not done:
+            timeout.check()
+            wait for something at most timeout.remaining seconds
+
+    check() fails the test case once the deadline of the scope, or of any scope it is nested in, has passed.
+    Scopes are kept per thread, so threads do not interfere and an inner scope never cancels the outer one.
     """
 
+    _local = threading.local()
+
     def __init__(self, timeout_secs, msg='Timeout after'):
-        self._timeout_secs = int(timeout_secs)
+        self._timeout_secs = float(timeout_secs)
         self.msg = msg
         self._start_time = None
         self._duration = 0.0
         self._running = False
+        self.deadline = None
+        self.parent = None
 
     def __enter__(self):
         self.start()
@@ -138,25 +213,58 @@ class Timeout(object):
     def __exit__(self, *args):
         self.stop()
 
-    def _raise_timeout(self, *args):
-        """Callback function that fail after the timer expires."""
-        self._duration = time.time() - self._start_time
-        self._running = False
-        fail(f'{self.msg} ~ {formatted_seconds(self._timeout_secs)}')
+    @classmethod
+    def scopes(cls):
+        if not hasattr(cls._local, 'scopes'):
+            cls._local.scopes = []
+        return cls._local.scopes
+
+    @classmethod
+    def current(cls):
+        """Returns the innermost Timeout running in this thread, None outside of any."""
+        scopes = cls.scopes()
+        return scopes[-1] if scopes else None
 
     def start(self):
         """Starts the timer."""
-        self._start_time = time.time()
+        self._start_time = time.monotonic()
+        self.deadline = self._start_time + self._timeout_secs
+        self.parent = self.current()
+        self.scopes().append(self)
         self._running = True
-        signal.signal(signal.SIGALRM, self._raise_timeout)
-        signal.alarm(self._timeout_secs)
 
     def stop(self):
         """Stops the timer."""
-        signal.alarm(0)
-        self._duration = time.time() - self._start_time
+        self.scopes().remove(self) if self in self.scopes() else None
+        self._duration = time.monotonic() - self._start_time
         self._running = False
 
+    def expired_scope(self):
+        """Returns the scope whose deadline passed first, this one or one it is nested in, None if none did."""
+        scope, now, expired = self, time.monotonic(), None
+        while scope:
+            if scope.deadline <= now and (expired is None or scope.deadline < expired.deadline):
+                expired = scope
+            scope = scope.parent
+        return expired
+
+    def check(self):
+        """Fails the test case if the deadline has passed."""
+        expired = self.expired_scope()
+        if expired:
+            expired._duration = time.monotonic() - expired._start_time
+            secs = expired.timeout_secs
+            fail(f'{expired.msg} ~ {formatted_seconds(secs) if secs >= 1 else f"{secs:g} s"}')
+
+    @property
+    def remaining(self):
+        """Seconds left before the earliest deadline of this scope and the scopes it is nested in."""
+        scope, deadline = self, self.deadline
+        while scope:
+            deadline = min(deadline, scope.deadline)
+            scope = scope.parent
+        return max(0.0, deadline - time.monotonic())
+
     @property
     def timeout_secs(self):
         return self._timeout_secs
@@ -170,13 +278,13 @@ class Timeout(object):
         if self._duration:
             return self._duration
         else:
-            return time.time() - self._start_time
+            return time.monotonic() - self._start_time
 
 
 def iss_service(func):
     def wrapper(*args, **kwargs):
         try:
-            log.info(f'---> Starting Step "{BuiltIn().get_variable_value("${TEST NAME}")}" ({func.__module__}.{func.__name__})')
+            log.info(f'---> Starting Step "{get_variable("${TEST NAME}")}" ({func.__module__}.{func.__name__})')
             return func(*args, **kwargs)
         except AssertionError:
             raise
@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import threading
+import traceback
+
+
+class LogWriter(threading.Thread):
+    """Background writer appending text to log files.
+
+    Messages are queued by the callers and written by this single thread, so the order is kept per file, through
+    file handles that stay open between writes. Pending messages are written once flush_interval seconds elapsed,
+    once more than flush_size characters are pending, or when flush() is called.
+    """
+
+    def __init__(self, flush_interval=.5, flush_size=65536):
+        super().__init__(name='LogWriter', daemon=True)
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._queue = queue.SimpleQueue()
+        self._files = {}
+        self._pending = {}
+        self._pending_size = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, path, msg):
+        self._queue.put((path, msg))
+
+    def flush(self, close=False, timeout=None):
+        """Block until every message queued before this call is written to disk.
+
+        :param bool close: also close the cached file handles, they are reopened on the next write.
+        :param timeout: seconds to wait for the writer, forever by default.
+        """
+        done = threading.Event()
+        self._queue.put((None, (done, close)))
+        done.wait(timeout)
+
+    def run(self):
+        while True:
+            timeout = max(0, self._last_flush + self.flush_interval - time.monotonic()) if self._pending else None
+            try:
+                path, msg = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._write_pending()
+                continue
+            if path is None:
+                done, close = msg
+                self._write_pending()
+                self._close_files() if close else None
+                done.set()
+                continue
+            self._pending.setdefault(path, []).append(msg)
+            self._pending_size += len(msg)
+            if self._pending_size >= self.flush_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._write_pending()
+
+    def _write_pending(self):
+        for path, msgs in self._pending.items():
+            try:
+                f = self._files.get(path)
+                if f is None:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    f = self._files[path] = open(path, 'a+', encoding="utf-8")
+                f.write(''.join(msgs))
+                f.flush()
+            except Exception:
+                sys.stderr.write(traceback.format_exc())
+        self._pending = {}
+        self._pending_size = 0
+        self._last_flush = time.monotonic()
+
+    def _close_files(self):
+        for f in self._files.values():
+            try:
+                f.close()
+            except Exception:
+                pass
+        self._files = {}
+
+
+_WRITER = None
+_LOCK = threading.Lock()
+
+
+def get_writer():
+    global _WRITER
+    with _LOCK:
+        if _WRITER is None or not _WRITER.is_alive():
+            _WRITER = LogWriter()
+            _WRITER.start()
+    return _WRITER
+
+
+def write(path, msg):
+    get_writer().write(path, msg)
+
+
+def flush(close=False, timeout=None):
+    if _WRITER is not None and _WRITER.is_alive():
+        _WRITER.flush(close=close, timeout=timeout)
+
+
+atexit.register(flush, close=True, timeout=10)
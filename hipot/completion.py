@@ -0,0 +1,123 @@
+import math
+import time
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+RUNNING = ('RAMP', 'DWELL', 'DELAY', 'TESTING', 'CHARGING')
+
+
+def parse(recbuf):
+    """Splits a TD? reply, e.g. '01,ACW,Pass,1.24,0.325,1.0', into its fields."""
+    return [field.strip() for field in recbuf.strip().split(',')]
+
+
+def is_running(fields, last_step=None):
+    """True while the TD? status is a ramp, dwell or delay one, or the reply was incomplete.
+
+    With last_step, a step passed before the last one means the sequence is still running.
+    """
+    if len(fields) < 3 or fields[2].upper().startswith(RUNNING):
+        return True
+    return bool(last_step) and fields[2].upper() == 'PASS' and fields[0].isdigit() and int(fields[0]) < last_step
+
+
+def off(value, default=0):
+    """The value programmed for a parameter the caller left out (None), default being the one that turns it off."""
+    return default if value is None else value
+
+
+def lower_bound(*seconds):
+    """Adds up the ramp and dwell times programmed, skipping the parameters the instrument does not use."""
+    return sum(float(s) for s in seconds if isinstance(s, (int, float)))
+
+
+def wait_ready(connection, timeout=10, interval=.1):
+    """Polls *OPC? until the instrument answers 1, after *RST for instance.
+
+    :return float: seconds waited, None if *OPC? was not answered within timeout.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    while time.monotonic() < deadline:
+        if connection.probe('*OPC?\n', '1', timeout=min(1, max(0, deadline - time.monotonic()))) >= 0:
+            break
+        time.sleep(interval)
+    else:
+        log.warning('*OPC? not answered within %s s', timeout)
+        return None
+    return time.monotonic() - start
+
+
+def wait_result(connection, minimum=0, timeout=10, interval=.05, max_interval=.5, last_step=None, cancel=None,
+                samples=None):
+    """Waits for the end of the test started with TEST and returns the last TD? reply.
+
+    TD? is not sent before minimum seconds, the ramp and dwell times programmed. It is then polled with an interval
+    growing from interval to max_interval until the status is no longer a running one, or timeout seconds later.
+    last_step is the number of steps of a sequence run with fail stop, see is_running. Waiting stops as soon as the
+    threading.Event cancel is set.
+
+    With samples, a measurements.MeasurementBuffer, TD? is polled from the start every samples.interval seconds
+    and every reply is appended to it. A status that is not a running one only ends the wait once minimum elapsed.
+
+    :return: (fields of the TD? reply, seconds waited, number of TD? sent)
+    """
+    start = time.monotonic()
+    cancel = cancel if cancel else threading.Event()
+    if samples is not None:
+        samples.start_run()
+        interval = max_interval = samples.interval
+    else:
+        cancel.wait(minimum)
+    deadline = start + minimum + timeout
+    fields, polls = [], 0
+    while not cancel.is_set():
+        polls += 1
+        if connection.probe('TD?\n', '\n', timeout=1) >= 0:
+            fields = parse(connection.recbuf)
+            samples.append_fields(fields) if samples is not None else None
+            if not is_running(fields, last_step) and time.monotonic() - start >= minimum:
+                break
+        if time.monotonic() >= deadline:
+            log.warning('TD? still running after %.1f s', time.monotonic() - start)
+            break
+        cancel.wait(interval)
+        interval = min(max_interval, interval * 1.5)
+    return fields, time.monotonic() - start, polls
+
+
+def read_step(connection, step):
+    """Reads the result of step of the last test run with RD <step>?, see step_result."""
+    return step_result(parse(connection.recbuf) if connection.probe(f'RD {step}?\n', '\n', timeout=1) >= 0 else [],
+                       step)
+
+
+def step_result(fields, step=None):
+    """
+    :return dict: step, test, status, passed and the meter readings in data, status is '' if the reply was empty.
+    """
+    fields = fields + [''] * (3 - len(fields))
+    return {'step': int(fields[0]) if fields[0].isdigit() else step,
+            'test': fields[1],
+            'status': fields[2],
+            'passed': fields[2].upper() == 'PASS',
+            'data': fields[3:]}
+
+
+def fixed_result_wait(waited):
+    """Seconds the former fixed polling (2 s, then TD? every 1 s) took to see a test that ended after waited s."""
+    return max(3, math.ceil(waited))
+
+
+def report(timings):
+    """Formats the (name, seconds waited, seconds of the former fixed sleeps) recorded by a driver. The drivers only
+    record the waits that ended with the instrument ready or the test done, not the ones cancelled or timed out.
+
+    :return str: one line per wait and the total saved.
+    """
+    lines = [f'{name:<8} waited {waited:6.2f} s, fixed {fixed:6.2f} s, saved {fixed - waited:6.2f} s'
+             for name, waited, fixed in timings]
+    lines.append(f'{"Total":<8} saved {sum(fixed - waited for _, waited, fixed in timings):.2f} s')
+    return '\n'.join(lines)
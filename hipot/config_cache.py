@@ -0,0 +1,52 @@
+import logging
+from engine import store
+
+log = logging.getLogger(__name__)
+
+TTL = 3600
+
+
+def namespace(serial):
+    return f'hipot::{serial}'
+
+
+def get(serial, file_number, step):
+    """Returns the add command last programmed at step of file_number on the instrument serial, None if unknown."""
+    return store.get_store().get(namespace(serial), f'{file_number}|{step}')
+
+
+def set(serial, file_number, step, command, ttl=None):
+    store.get_store().set(namespace(serial), f'{file_number}|{step}', command, ttl=ttl if ttl else TTL)
+
+
+def delete(serial, file_number, step):
+    store.get_store().delete(namespace(serial), f'{file_number}|{step}')
+
+
+def get_steps(serial, file_number, count):
+    """Returns the add commands last programmed at the steps of file_number, None if they are not the count first ones.
+
+    The number of steps is kept at step 0, so that a file holding more steps than count does not match.
+    """
+    keys = [f'{file_number}|{step}' for step in range(count + 1)]
+    values = store.get_store().get_many(namespace(serial), keys)
+    return values[1:] if values[0] == str(count) else None
+
+
+def set_steps(serial, file_number, commands, ttl=None):
+    mapping = dict((f'{file_number}|{step}', command) for step, command in enumerate(commands, 1))
+    mapping[f'{file_number}|0'] = len(commands)
+    store.get_store().set_many(namespace(serial), mapping, ttl=ttl if ttl else TTL)
+
+
+def delete_steps(serial, file_number):
+    """Forgets the steps programmed in file_number, they are rewritten."""
+    count = store.get_store().get(namespace(serial), f'{file_number}|0')
+    steps = range(int(count) + 1 if count else 2)
+    store.get_store().delete_many(namespace(serial), [f'{file_number}|{step}' for step in steps])
+
+
+def invalidate(serial):
+    """Forgets every step programmed on the instrument serial."""
+    log.info('Hipot %s: step config cache invalidated', serial)
+    store.get_store().sweep(namespace(serial))
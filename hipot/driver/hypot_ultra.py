@@ -1,6 +1,8 @@
-import time
 import logging
+import threading
 from datetime import datetime
+from hipot import completion
+from hipot import config_cache
 
 log = logging.getLogger(__name__)
 
@@ -15,9 +17,16 @@ class Driver(object):
         :return:
         """
         log.info('Initializing HypotULTRAM Driver...')
-        time.sleep(3)
         self.file_number = 0
+        self.timings = []
+        self.config_ttl = config_cache.TTL
+        self.seq_file = 4
+        self.cancel = threading.Event()
+        self.samples = None
         self.__connection = connection
+        self.opened_at = connection.opened_at
+        waited = completion.wait_ready(self.__connection)
+        self.timings.append(('*OPC?', waited, 3)) if waited is not None else None
         # Removed RST since is causing some instrument to hang and fail to init
         # self.__connection.send('*RST\n')
         # time.sleep(7)
@@ -50,7 +59,9 @@ class Driver(object):
         """
         log.info('Send *RST')
         self.__connection.send('*RST\n')
-        time.sleep(5)
+        waited = completion.wait_ready(self.__connection)
+        self.timings.append(('*RST', waited, 5)) if waited is not None else None
+        config_cache.invalidate(self.serial)
 
     def check_interlock(self):
         """
@@ -84,21 +95,25 @@ class Driver(object):
     def file_total_qty(self, qty):
         """
         :param qty:
-        Verifies that GND, ACW and DCW settings files are created, if not creates them
+        Verifies that GND, ACW and DCW settings files are created, if not creates them. The SEQ file is created by
+        program_sequence on the first sequence test
         """
 
         self.__connection.send('LF 1?\n', expectphrase='\n', timeout=3)
         if '01,GND' not in self.__connection.recbuf:
+            config_cache.invalidate(self.serial)
             self.__connection.send('FD 1\n', expectphrase='\n', timeout=3)
             self.__connection.send('FN 1,GND\n', expectphrase='\n', timeout=3)
 
         self.__connection.send('LF 2?\n', expectphrase='\n', timeout=3)
         if '02,ACW' not in self.__connection.recbuf:
+            config_cache.invalidate(self.serial)
             self.__connection.send('FD 2\n', expectphrase='\n', timeout=3)
             self.__connection.send('FN 2,ACW\n', expectphrase='\n', timeout=3)
 
         self.__connection.send('LF 3?\n', expectphrase='\n', timeout=3)
         if '03,DCW' not in self.__connection.recbuf:
+            config_cache.invalidate(self.serial)
             self.__connection.send('FD 3\n', expectphrase='\n', timeout=3)
             self.__connection.send('FN 3,DCW\n', expectphrase='\n', timeout=3)
 
@@ -126,11 +141,13 @@ class Driver(object):
             self.file_number = 2
         elif file_name == 'DCW':
             self.file_number = 3
+        elif file_name == 'SEQ':
+            self.file_number = self.seq_file
         else:
             log.info('invalid file_name')
         self.__connection.send(f'FL {self.file_number}\n', expectphrase='\n', timeout=3)
 
-    def select_step(self):
+    def select_step(self, step=1):
         """
         SS <step number>
         Selects the active selected step to load into RAM.
@@ -138,45 +155,128 @@ class Driver(object):
         parameters can be edited.
         """
 
-        log.info('Send SS 1')
-        self.__connection.send('SS 1\n', expectphrase='\n', timeout=3)
+        log.info('Send SS %s', step)
+        self.__connection.send(f'SS {step}\n', expectphrase='\n', timeout=3)
 
-    def test_data_result(self):
+    def program_step(self, command, step=1):
+        """
+        Programs the selected step of the loaded file with command, unless the config cache or the LS? readback
+        show it is already
+        :param command: add command of the step
+        :param step: step number selected
+        """
+        if self.__connection.opened_at != self.opened_at:
+            config_cache.invalidate(self.serial)
+            self.opened_at = self.__connection.opened_at
+        if config_cache.get(self.serial, self.file_number, step) == command:
+            log.info('Step %s of file %s already programmed', step, self.file_number)
+            return
+
+        log.info('LS?')
+        self.__connection.send('LS?\n', expectphrase='\n', timeout=3)
+        response = self.__connection.recbuf
+        response = response[3:].strip()
+        log.info(response)
+        log.info(command)
+        if command.find(response) <= 0:
+            log.info('Stored Step params do not match actual config')
+            config_cache.delete(self.serial, self.file_number, step)
+            log.info('Send SD')
+            self.__connection.send('SD\n', expectphrase='\n', timeout=3)
+            log.info(command)
+            self.__connection.send(f'{command}\n', expectphrase='\n', timeout=3)
+            log.info('FS')
+            self.__connection.send('FS\n', expectphrase='\n', timeout=3)
+        config_cache.set(self.serial, self.file_number, step, command, ttl=self.config_ttl)
+
+    def sequence_test(self, steps):
+        """
+        Programs steps as the consecutive steps of the SEQ file and runs them with a single TEST under fail stop
+        :param steps: list of (add command, ramp and dwell seconds) returned by the *_step methods, in test order
+        :return: list of the RD <step>? fields of every step, see completion.step_result
+        """
+        if not steps:
+            raise Exception('hipot sequence test needs at least one step')
+        self.stop_test()
+        self.file_number = self.seq_file
+        self.program_sequence([command for command, _ in steps])
+        self.start_test()
+        log.info('Start sequence test of %s steps', len(steps))
+        response, waited, polls = completion.wait_result(self.__connection, sum(seconds for _, seconds in steps),
+                                                         last_step=len(steps), cancel=self.cancel,
+                                                         samples=self.samples)
+        self.check_cancel()
+        if not completion.is_running(response, len(steps)):
+            self.timings.append(('SEQ', waited, len(steps) * completion.fixed_result_wait(waited / len(steps))))
+        log.info('%s %.2f s, %s polls', response, waited, polls)
+        return [completion.read_step(self.__connection, step) for step in range(1, len(steps) + 1)]
+
+    def program_sequence(self, commands):
+        """
+        Writes commands as the steps of file file_number, creating it, and loads the file. The file is only loaded
+        when the config cache shows it holds them already
+        :param commands: add commands of the steps, in order
+        """
+        if self.__connection.opened_at != self.opened_at:
+            config_cache.invalidate(self.serial)
+            self.opened_at = self.__connection.opened_at
+        if config_cache.get_steps(self.serial, self.file_number, len(commands)) == commands:
+            log.info('File %s already programmed with %s steps', self.file_number, len(commands))
+            self.__connection.send(f'FL {self.file_number}\n', expectphrase='\n', timeout=3)
+            return
+
+        config_cache.delete_steps(self.serial, self.file_number)
+        log.info('Send FD %s', self.file_number)
+        self.__connection.send(f'FD {self.file_number}\n', expectphrase='\n', timeout=3)
+        self.__connection.send(f'FN {self.file_number},SEQ\n', expectphrase='\n', timeout=3)
+        self.__connection.send(f'FL {self.file_number}\n', expectphrase='\n', timeout=3)
+        for command in commands:
+            log.info(command)
+            self.__connection.send(f'{command}\n', expectphrase='\n', timeout=3)
+        log.info('FS')
+        self.__connection.send('FS\n', expectphrase='\n', timeout=3)
+        config_cache.set_steps(self.serial, self.file_number, commands, ttl=self.config_ttl)
+
+    def test_data_result(self, minimum=0):
         """
         command: TD?
         Read the active data being displayed on the LCD display
         while the test is in process. Will also read the last
         data taken when the test sequence has completed.
+        :param minimum: ramp and dwell seconds programmed, TD? is polled once they elapsed.
         """
-        time.sleep(2)
-        for retries in range(1, 11):
-            time.sleep(1)
-            self.__connection.send('TD?\n', expectphrase='\n', timeout=3)
-            response = self.__connection.recbuf.split(',')
-            if self.__connection.recbuf.split(',')[2] in ['Pass', 'PASS']:
-                response = self.__connection.recbuf.split(',')
-                log.info(response)
-                return response
-            elif retries == 10:
-                raise Exception('hipot {} Failure: {} test_status'.format(response[1], response[2]))
+        response = self.wait_result(minimum)
+        if response[2] in ['Pass', 'PASS']:
+            return response
+        raise Exception('hipot {} Failure: {} test_status'.format(response[1], response[2]))
 
-    def margin_test_data_result(self):
+    def margin_test_data_result(self, minimum=0):
         """
         command: TD?
         Read the active data being displayed on the LCD display
         while the test is in process. Will also read the last
         data taken when the test sequence has completed.
+        :param minimum: ramp and dwell seconds programmed, TD? is polled once they elapsed.
         """
-        time.sleep(2)
-        for retries in range(1, 11):
-            time.sleep(1)
-            self.__connection.send('TD?\n', expectphrase='\n', timeout=3)
-            response = self.__connection.recbuf.split(',')
-            if response[2] in ['HI-LIMIT', 'HI-Limit', 'HI-LIMIT T', 'HI-Limit T', 'HI-Lmt T']:
-                log.info(response)
-                return response
-            elif retries == 10:
-                raise Exception(f'hipot {response[1]} Failure: {response[2]} test_status')
+        response = self.wait_result(minimum)
+        if response[2] in ['HI-LIMIT', 'HI-Limit', 'HI-LIMIT T', 'HI-Limit T', 'HI-Lmt T']:
+            return response
+        raise Exception(f'hipot {response[1]} Failure: {response[2]} test_status')
+
+    def wait_result(self, minimum=0):
+        response, waited, polls = completion.wait_result(self.__connection, minimum, cancel=self.cancel,
+                                                         samples=self.samples)
+        self.check_cancel()
+        if not completion.is_running(response):
+            self.timings.append(('TD?', waited, completion.fixed_result_wait(waited)))
+        log.info('%s %.2f s, %s polls', response, waited, polls)
+        return response + [''] * (3 - len(response))
+
+    def timing_report(self):
+        """
+        Returns the seconds waited for *RST and TD? completion against the former fixed sleeps
+        """
+        return completion.report(self.timings)
 
     def start_test(self):
         """
@@ -189,6 +289,9 @@ class Driver(object):
         0 sets the Fail Stop = OFF.
         """
 
+        if self.cancel.is_set():
+            log.info('Test cancelled, TEST not sent')
+            return
         log.info('SF 1')
         self.__connection.send('SF 1\n', expectphrase='\n', timeout=3)
         log.info('Send TEST')
@@ -209,6 +312,24 @@ class Driver(object):
         log.info('Send RESET')
         self.__connection.send('RESET\n', expectphrase='\n', timeout=3)
 
+    def check_cancel(self):
+        """
+        Aborts the test with RESET and raises when the run was cancelled, see hipot.HipotRun.cancel
+        """
+        if self.cancel.is_set():
+            self.stop_test()
+            raise Exception('hipot test cancelled')
+
+    def continuity_step(self, current, voltage, hi_limit, lo_limit, hi_limit_v, lo_limit_v, dwell, offset, offset_v,
+                        frequency, **kwargs):
+        """
+        Returns the add command of a continuity step and the ramp and dwell seconds it lasts, see continuity_test.
+        Parameters of the other drivers are ignored.
+        """
+        command = f'ADD2 GND,{current:.2f},{voltage:.2f},{hi_limit},{lo_limit},{hi_limit_v},{lo_limit_v},{dwell:.1f},' \
+                  f'{offset},{offset_v},{frequency}'
+        return command, completion.lower_bound(dwell)
+
     def continuity_test(self, current, voltage, hi_limit, lo_limit, hi_limit_v, lo_limit_v, dwell, offset, offset_v,
                         frequency, margin_test=False):
         """
@@ -231,30 +352,31 @@ class Driver(object):
         self.stop_test()
         self.file_load('GND')
         self.select_step()
-
-        self.__connection.send('LS?\n', expectphrase='\n', timeout=3)
-        response = self.__connection.recbuf
-        response = response[3:].strip()
-        log.info(response)
-        command = f'ADD2 GND,{current:.2f},{voltage:.2f},{hi_limit},{lo_limit},{hi_limit_v},{lo_limit_v},{dwell:.1f},' \
-                  f'{offset},{offset_v},{frequency}'
-
-        log.info(command)
-        if command.find(response) <= 0:
-            log.info('Stored Step params do not match actual config')
-            self.__connection.send('SD\n', expectphrase='\n', timeout=3)
-            self.__connection.send(f'{command}\n', expectphrase='\n', timeout=3)
-            self.__connection.send('FS\n', expectphrase='\n', timeout=3)
+        command, seconds = self.continuity_step(current, voltage, hi_limit, lo_limit, hi_limit_v, lo_limit_v, dwell,
+                                                offset, offset_v, frequency)
+        self.program_step(command)
         self.start_test()
 
         if margin_test:
             log.info('Start Continuity margin test')
-            test_status = self.margin_test_data_result()
+            test_status = self.margin_test_data_result(seconds)
         else:
             log.debug('Start Continuity test')
-            test_status = self.test_data_result()
+            test_status = self.test_data_result(seconds)
         return test_status
 
+    def ac_hipot_step(self, voltage, hi_limit_t, lo_limit_t, ramp_up, dwell, arc_sense, frequency, ramp_down,
+                      hi_limit_r, lo_limit_r, arc_detect, continuity, **kwargs):
+        """
+        Returns the add command of an AC hipot step and the ramp and dwell seconds it lasts, see ac_hipot_test.
+        Parameters of the other drivers are ignored.
+        """
+        off = completion.off
+        command = f'ADD2 ACW,{voltage},{hi_limit_t:.2f},{lo_limit_t:.3f},{ramp_up:.1f},{dwell:.1f},{arc_sense:.1f},' \
+                  f'{off(ramp_down)},{off(hi_limit_r):.2f},{off(lo_limit_r):.3f},{frequency},' \
+                  f'{off(arc_detect, "OFF")},{off(continuity, "OFF")}'
+        return command, completion.lower_bound(ramp_up, dwell, ramp_down)
+
     def ac_hipot_test(self, voltage, hi_limit_t, lo_limit_t, ramp_up, dwell, arc_sense, frequency, ramp_down,
                       hi_limit_r, lo_limit_r, arc_detect, continuity, margin_test=False):
         """
@@ -291,36 +413,32 @@ class Driver(object):
         self.stop_test()
         self.file_load('ACW')
         self.select_step()
-
-        log.info('LS?')
-        self.__connection.send('LS?\n', expectphrase='\n', timeout=3)
-        response = self.__connection.recbuf
-        response = response[3:].strip()
-        log.info(response)
-        command = f'ADD2 ACW,{voltage},{hi_limit_t:.2f},{lo_limit_t:.3f},{ramp_up:.1f},{dwell:.1f},{arc_sense:.1f},' \
-                  f'{ramp_down},{hi_limit_r:.2f},{lo_limit_r:.3f},{frequency},{arc_detect},{continuity}'
-
-        log.info(command)
-        if command.find(response) <= 0:
-            log.info('Stored Step params do not match actual config')
-            log.info('Send SD')
-            self.__connection.send('SD\n', expectphrase='\n', timeout=3)
-            log.debug(command)
-            self.__connection.send(f'{command}\n', expectphrase='\n', timeout=3)
-            log.debug('FS')
-            self.__connection.send('FS\n', expectphrase='\n', timeout=3)
-
+        command, seconds = self.ac_hipot_step(voltage, hi_limit_t, lo_limit_t, ramp_up, dwell, arc_sense, frequency,
+                                              ramp_down, hi_limit_r, lo_limit_r, arc_detect, continuity)
+        self.program_step(command)
         self.start_test()
 
         if margin_test:
             log.info('Start ACW margin test')
-            test_status = self.margin_test_data_result()
+            test_status = self.margin_test_data_result(seconds)
         else:
             log.debug('Start ACW test')
-            test_status = self.test_data_result()
+            test_status = self.test_data_result(seconds)
 
         return test_status
 
+    def dc_hipot_step(self, voltage, hi_limit, lo_limit, ramp_up, dwell, ramp_down, charge_lo, arc_sense, offset,
+                      ramp_hi, arc_detect, continuity, range, low_range, **kwargs):
+        """
+        Returns the add command of a DC hipot step and the ramp and dwell seconds it lasts, see dc_hipot_test.
+        Parameters of the other drivers are ignored.
+        """
+        off = completion.off
+        command = f'ADD2 DCW,{voltage},{hi_limit},{lo_limit:.1f},{ramp_up:.1f},{dwell:.1f},{off(ramp_down):.1f},' \
+                  f'{charge_lo:.1f},{arc_sense},{offset:.1f},{ramp_hi:.1f},{off(arc_detect, "OFF")},' \
+                  f'{off(continuity, "OFF")},{range},{low_range}'
+        return command, completion.lower_bound(ramp_up, dwell, ramp_down)
+
     def dc_hipot_test(self, voltage, hi_limit, lo_limit, ramp_up, dwell, ramp_down, charge_lo, arc_sense,
                       offset, ramp_hi, arc_detect, continuity, range, low_range, margin_test=False):
         """
@@ -360,27 +478,15 @@ class Driver(object):
         self.stop_test()
         self.file_load('DCW')
         self.select_step()
-
-        log.info('LS?')
-        self.__connection.send('LS?\n', expectphrase='\n', timeout=3)
-        response = self.__connection.recbuf
-        response = response[3:].strip()
-        log.info(response)
-        command = f'ADD2 DCW,{voltage},{hi_limit},{lo_limit:.1f},{ramp_up:.1f},{dwell:.1f},{ramp_down:.1f},' \
-                  f'{charge_lo:.1f},{arc_sense},{offset:.1f},{ramp_hi:.1f},{arc_detect},{continuity},{range},{low_range}'
-
-        log.info(command)
-        if command.find(response) <= 0:
-            log.info('Stored Step params do not match actual config')
-            self.__connection.send('SD\n', expectphrase='\n', timeout=3)
-            self.__connection.send(f'{command}\n', expectphrase='\n', timeout=3)
-            self.__connection.send('FS\n', expectphrase='\n', timeout=3)
+        command, seconds = self.dc_hipot_step(voltage, hi_limit, lo_limit, ramp_up, dwell, ramp_down, charge_lo,
+                                              arc_sense, offset, ramp_hi, arc_detect, continuity, range, low_range)
+        self.program_step(command)
         self.start_test()
 
         if margin_test:
             log.info('Start DCW margin test')
-            test_status = self.margin_test_data_result()
+            test_status = self.margin_test_data_result(seconds)
         else:
             log.debug('Start DCW test')
-            test_status = self.test_data_result()
+            test_status = self.test_data_result(seconds)
         return test_status
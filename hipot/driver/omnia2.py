@@ -1,6 +1,9 @@
 import time
 import logging
+import threading
 from apollo.libs import lib
+from hipot import completion
+from hipot import config_cache
 
 log = logging.getLogger(__name__)
 
@@ -16,9 +19,16 @@ class Driver(object):
         """
         log.info('Initializing Omnia Driver...')
         self.file_number = 0
+        self.timings = []
+        self.config_ttl = config_cache.TTL
+        self.seq_file = 4
+        self.cancel = threading.Event()
+        self.samples = None
         self.__connection = connection
+        self.opened_at = connection.opened_at
         self.__connection.send('*RST\n')
-        time.sleep(7)
+        waited = completion.wait_ready(self.__connection)
+        self.timings.append(('*RST', waited, 7)) if waited is not None else None
         self.__connection.send('*IDN?\n', expectphrase='ASSOCIATED RESEARCH', timeout=3)
         response = self.__connection.recbuf.split(',')
         hipot_model = response[1]
@@ -43,26 +53,32 @@ class Driver(object):
         """
         log.info('Send *RST')
         self.__connection.send('*RST\n')
-        time.sleep(5)
+        waited = completion.wait_ready(self.__connection)
+        self.timings.append(('*RST', waited, 5)) if waited is not None else None
+        config_cache.invalidate(self.serial)
 
     def file_total_qty(self, qty):
         """
         :param qty:
-        Verifies that GND, ACW and DCW settings files are created, if not creates them
+        Verifies that GND, ACW and DCW settings files are created, if not creates them. The SEQ file is created by
+        program_sequence on the first sequence test
         """
 
         self.__connection.send('LF 1?\n', expectphrase='', timeout=1)
         if '01,GND' not in self.__connection.recbuf:
+            config_cache.invalidate(self.serial)
             self.__connection.send('FD 1\n', expectphrase='006', timeout=1)
             self.__connection.send('FN 1,GND\n', expectphrase='006', timeout=1)
 
         self.__connection.send('LF 2?\n', expectphrase='', timeout=1)
         if '02,ACW' not in self.__connection.recbuf:
+            config_cache.invalidate(self.serial)
             self.__connection.send('FD 2\n', expectphrase='006', timeout=1)
             self.__connection.send('FN 2,ACW\n', expectphrase='006', timeout=1)
 
         self.__connection.send('LF 3?\n', expectphrase='', timeout=1)
         if '03,DCW' not in self.__connection.recbuf:
+            config_cache.invalidate(self.serial)
             self.__connection.send('FD 3\n', expectphrase='006', timeout=1)
             self.__connection.send('FN 3,DCW\n', expectphrase='006', timeout=1)
 
@@ -71,7 +87,8 @@ class Driver(object):
         total_files = int(self.__connection.foundphrase[0])
 
         if qty < total_files:
-            for x in xrange(total_files, qty, -1):
+            config_cache.invalidate(self.serial)
+            for x in range(total_files, qty, -1):
                 log.info(f'Send FD {x}')
                 self.__connection.send(f'FD {x}\n', expectphrase='006', timeout=1)
 
@@ -88,13 +105,15 @@ class Driver(object):
             self.file_number = 2
         elif file_name == 'DCW':
             self.file_number = 3
+        elif file_name == 'SEQ':
+            self.file_number = self.seq_file
         else:
             log.debug('invalid file_name')
 
         log.info(f'Send FL {str(self.file_number)}')
         self.__connection.send(f'FL {str(self.file_number)}\n', expectphrase='006', timeout=1)
 
-    def select_step(self):
+    def select_step(self, step=1):
         """
         SS <step number>
         Selects the active selected step to load into RAM.
@@ -102,64 +121,121 @@ class Driver(object):
         parameters can be edited.
         """
 
-        log.info('Send SS 1')
-        self.__connection.send('SS 1\n', expectphrase='006', timeout=1)
+        log.info('Send SS %s', step)
+        self.__connection.send(f'SS {step}\n', expectphrase='006', timeout=1)
 
-    def test_data_result(self):
+    def program_step(self, command, step=1):
+        """
+        Programs the selected step of the loaded file with command, unless the config cache or the LS? readback
+        show it is already
+        :param command: add command of the step
+        :param step: step number selected
+        """
+        if self.__connection.opened_at != self.opened_at:
+            config_cache.invalidate(self.serial)
+            self.opened_at = self.__connection.opened_at
+        if config_cache.get(self.serial, self.file_number, step) == command:
+            log.info('Step %s of file %s already programmed', step, self.file_number)
+            return
+
+        log.info('LS?')
+        self.__connection.send('LS?\n')
+        time.sleep(1)
+        response = self.__connection.recbuf
+        response = response[3:].strip()
+        log.info(response)
+        log.info(command)
+        if command.find(response) <= 0:
+            log.info('Stored Step params do not match actual config')
+            config_cache.delete(self.serial, self.file_number, step)
+            log.info('Send SD')
+            self.__connection.send('SD\n', expectphrase='006', timeout=1)
+            log.info(command)
+            self.__connection.send(f'{command}\n', expectphrase='006', timeout=1)
+            log.info('FS')
+            self.__connection.send('FS\n', expectphrase='006', timeout=1)
+        config_cache.set(self.serial, self.file_number, step, command, ttl=self.config_ttl)
+
+    def sequence_test(self, steps):
+        """
+        Programs steps as the consecutive steps of the SEQ file and runs them with a single TEST under fail stop
+        :param steps: list of (add command, ramp and dwell seconds) returned by the *_step methods, in test order
+        :return: list of the RD <step>? fields of every step, see completion.step_result
+        """
+        if not steps:
+            raise Exception('hipot sequence test needs at least one step')
+        self.stop_test()
+        self.file_number = self.seq_file
+        self.program_sequence([command for command, _ in steps])
+        self.start_test()
+        log.info('Start sequence test of %s steps', len(steps))
+        response, waited, polls = completion.wait_result(self.__connection, sum(seconds for _, seconds in steps),
+                                                         last_step=len(steps), cancel=self.cancel,
+                                                         samples=self.samples)
+        self.check_cancel()
+        if not completion.is_running(response, len(steps)):
+            self.timings.append(('SEQ', waited, len(steps) * completion.fixed_result_wait(waited / len(steps))))
+        log.info('%s %.2f s, %s polls', response, waited, polls)
+        return [completion.read_step(self.__connection, step) for step in range(1, len(steps) + 1)]
+
+    def program_sequence(self, commands):
+        """
+        Writes commands as the steps of file file_number, creating it, and loads the file. The file is only loaded
+        when the config cache shows it holds them already
+        :param commands: add commands of the steps, in order
+        """
+        if self.__connection.opened_at != self.opened_at:
+            config_cache.invalidate(self.serial)
+            self.opened_at = self.__connection.opened_at
+        if config_cache.get_steps(self.serial, self.file_number, len(commands)) == commands:
+            log.info('File %s already programmed with %s steps', self.file_number, len(commands))
+            self.__connection.send(f'FL {self.file_number}\n', expectphrase='006', timeout=1)
+            return
+
+        config_cache.delete_steps(self.serial, self.file_number)
+        log.info('Send FD %s', self.file_number)
+        self.__connection.send(f'FD {self.file_number}\n', expectphrase='006', timeout=1)
+        self.__connection.send(f'FN {self.file_number},SEQ\n', expectphrase='006', timeout=1)
+        self.__connection.send(f'FL {self.file_number}\n', expectphrase='006', timeout=1)
+        for command in commands:
+            log.info(command)
+            self.__connection.send(f'{command}\n', expectphrase='006', timeout=1)
+        log.info('FS')
+        self.__connection.send('FS\n', expectphrase='006', timeout=1)
+        config_cache.set_steps(self.serial, self.file_number, commands, ttl=self.config_ttl)
+
+    def test_data_result(self, minimum=0):
         """
         command: TD?
         Read the active data being displayed on the LCD display
         while the test is in process. Will also read the last
         data taken when the test sequence has completed.
+        :param minimum: ramp and dwell seconds programmed, TD? is polled once they elapsed.
         """
-        time.sleep(2)
-        retries = 0
-        response = ''
-
-        while retries < 10:
-            retries += 1
-            self.__connection.send('TD?\n', expectphrase='', timeout=1)
-            time.sleep(1)
-            response = self.__connection.recbuf.split(' ')
-            log.info(f'Test_Type:{response[1]}, Status:{response[2]}')
-
-            if response[2] in ['PASS']:
-                break
-
+        response, waited, polls = completion.wait_result(self.__connection, minimum, cancel=self.cancel,
+                                                         samples=self.samples)
+        self.check_cancel()
+        if not completion.is_running(response):
+            self.timings.append(('TD?', waited, completion.fixed_result_wait(waited)))
+        response += [''] * (3 - len(response))
+        log.info('Test_Type:%s, Status:%s, %.2f s, %s polls', response[1], response[2], waited, polls)
         return response
 
-        while True:
-            retries = retries+1
-            self.__connection.send('TD?\n', expectphrase='', timeout=1)
-            response = self.__connection.recbuf.split(',')
-            if self.__connection.recbuf.split(',')[2] in ['PASS']:
-                response = self.__connection.recbuf.split(',')
-                return response[1]
-            elif retries == 10:
-                raise Exception(f'hipot {response[1]} Failure: {response[2]} test_status')
-
-    def margin_test_data_result(self):
+    def margin_test_data_result(self, minimum=0):
         """
         command: TD?
         Read the active data being displayed on the LCD display
         while the test is in process. Will also read the last
         data taken when the test sequence has completed.
+        :param minimum: ramp and dwell seconds programmed, TD? is polled once they elapsed.
         """
-        time.sleep(2)
-        retries = 0
-        response = ''
-
-        while retries < 10:
-            retries += 1
-            self.__connection.send('TD?\n', expectphrase='\n', timeout=1)
-            time.sleep(1)
-            response = self.__connection.recbuf.split(',')
-            log.info(f'Test_Type:{response[1]}, Status:{ response[2]}')
+        return self.test_data_result(minimum)
 
-            if response[2] in ['HI-LIMIT', 'HI-Limit', 'HI-LIMIT T', 'HI-Limit T']:
-                break
-
-        return response
+    def timing_report(self):
+        """
+        Returns the seconds waited for *RST and TD? completion against the former fixed sleeps
+        """
+        return completion.report(self.timings)
 
     def start_test(self):
         """
@@ -172,6 +248,9 @@ class Driver(object):
         0 sets the Fail Stop = OFF.
         """
 
+        if self.cancel.is_set():
+            log.info('Test cancelled, TEST not sent')
+            return
         log.info('SF 1')
         self.__connection.send('SF 1\n', expectphrase='006', timeout=1)
         log.info('Send TEST')
@@ -192,6 +271,22 @@ class Driver(object):
         log.info('Send RESET')
         self.__connection.send('RESET\n', expectphrase='006', timeout=1)
 
+    def check_cancel(self):
+        """
+        Aborts the test with RESET and raises when the run was cancelled, see hipot.HipotRun.cancel
+        """
+        if self.cancel.is_set():
+            self.stop_test()
+            raise Exception('hipot test cancelled')
+
+    def continuity_step(self, current, voltage, hi_limit, lo_limit, dwell, offset, frequency, **kwargs):
+        """
+        Returns the add command of a continuity step and the ramp and dwell seconds it lasts, see continuity_test.
+        Parameters of the other drivers are ignored.
+        """
+        command = f'add GND,{current:.2f},{voltage:.2f},{hi_limit},{lo_limit},{dwell:.1f},{offset},{frequency}'
+        return command, completion.lower_bound(dwell)
+
     def continuity_test(self, current, voltage, hi_limit, lo_limit, dwell, offset, frequency, margin_test=False):
         """
         Omnia continuity test configuration and execution
@@ -209,36 +304,31 @@ class Driver(object):
         self.stop_test()
         self.file_load('GND')
         self.select_step()
-
-        log.info('LS?')
-        self.__connection.send('LS?\n')
-        time.sleep(1)
-        response = self.__connection.recbuf
-        response = response[3:].strip()
-        log.info(response)
-        command = f'add GND,{current:.2f},{voltage:.2f},{hi_limit},{lo_limit},{dwell:.1f},{offset},{frequency}'
-
-        log.info(command)
-        if command.find(response) <= 0:
-            log.info('Stored Step params do not match actual config')
-            log.info('Send SD')
-            self.__connection.send('SD\n', expectphrase='006', timeout=1)
-            log.info(command)
-            self.__connection.send(f'{command}\n', expectphrase='006', timeout=1)
-            log.info('FS')
-            self.__connection.send('FS\n', expectphrase='006', timeout=1)
-
+        command, seconds = self.continuity_step(current, voltage, hi_limit, lo_limit, dwell, offset, frequency)
+        self.program_step(command)
         self.start_test()
 
         if margin_test:
             log.info('Start Continuity margin test')
-            test_status = self.margin_test_data_result()
+            test_status = self.margin_test_data_result(seconds)
         else:
             log.info('Start Continuity test')
-            test_status = self.test_data_result()
+            test_status = self.test_data_result(seconds)
 
         return test_status
 
+    def ac_hipot_step(self, voltage, hi_limit_t, lo_limit_t, ramp_up, dwell, arc_sense, frequency, ramp_down,
+                      hi_limit_r, lo_limit_r, arc_detect, continuity, **kwargs):
+        """
+        Returns the add command of an AC hipot step and the ramp and dwell seconds it lasts, see ac_hipot_test.
+        Parameters of the other drivers are ignored.
+        """
+        off = completion.off
+        command = f'add ACW,{voltage},{hi_limit_t:.2f},{lo_limit_t:.3f},{ramp_up:.1f},{dwell:.1f},{arc_sense:.1f},' \
+                  f'{off(ramp_down)},{off(hi_limit_r):.2f},{off(lo_limit_r):.3f},{frequency},' \
+                  f'{off(arc_detect, "OFF")},{off(continuity, "OFF")}'
+        return command, completion.lower_bound(ramp_up, dwell, ramp_down)
+
     def ac_hipot_test(self, voltage, hi_limit_t, lo_limit_t, ramp_up, dwell, arc_sense, frequency, ramp_down,
                       hi_limit_r, lo_limit_r, arc_detect, continuity, margin_test=False):
         """
@@ -275,36 +365,31 @@ class Driver(object):
         self.stop_test()
         self.file_load('ACW')
         self.select_step()
-
-        log.info('LS?')
-        self.__connection.send('LS?\n')
-        time.sleep(1)
-        response = self.__connection.recbuf
-        response = response[3:].strip()
-        log.info(response)
-        command = f'add ACW,{voltage},{hi_limit_t:.2f},{lo_limit_t:.3f},{ramp_up:.1f},{dwell:.1f},{arc_sense:.1f},' \
-                  f'{ramp_down},{hi_limit_r:.2f},{lo_limit_r:.3f},{frequency},{arc_detect},{continuity}'
-        log.info(command)
-        if command.find(response) <= 0:
-            log.info('Stored Step params do not match actual config')
-            log.info('Send SD')
-            self.__connection.send('SD\n', expectphrase='006', timeout=1)
-            log.info(command)
-            self.__connection.send(f'{command}\n', expectphrase='006', timeout=1)
-            log.info('FS')
-            self.__connection.send('FS\n', expectphrase='006', timeout=1)
-
+        command, seconds = self.ac_hipot_step(voltage, hi_limit_t, lo_limit_t, ramp_up, dwell, arc_sense, frequency,
+                                              ramp_down, hi_limit_r, lo_limit_r, arc_detect, continuity)
+        self.program_step(command)
         self.start_test()
 
         if margin_test:
             log.info('Start ACW margin test')
-            test_status = self.margin_test_data_result()
+            test_status = self.margin_test_data_result(seconds)
         else:
             log.info('Start ACW test')
-            test_status = self.test_data_result()
+            test_status = self.test_data_result(seconds)
 
         return test_status
 
+    def dc_hipot_step(self, voltage, hi_limit, lo_limit, ramp_up, dwell, charge_lo, arc_sense, ramp_hi, arc_detect,
+                      ramp_down, continuity, **kwargs):
+        """
+        Returns the add command of a DC hipot step and the ramp and dwell seconds it lasts, see dc_hipot_test.
+        Parameters of the other drivers are ignored.
+        """
+        off = completion.off
+        command = f'add DCW,{voltage},{hi_limit},{lo_limit:.1f},{ramp_up:.1f},{dwell:.1f},{off(ramp_down):.1f},' \
+                  f'{charge_lo:.1f},{arc_sense},{ramp_hi},{off(arc_detect, "OFF")},{off(continuity, "OFF")}'
+        return command, completion.lower_bound(ramp_up, dwell, ramp_down)
+
     def dc_hipot_test(self, voltage, hi_limit, lo_limit, ramp_up, dwell, charge_lo, arc_sense, ramp_hi, arc_detect,
                       ramp_down, continuity, margin_test=False):
         """
@@ -342,33 +427,17 @@ class Driver(object):
         self.stop_test()
         self.file_load('DCW')
         self.select_step()
-
-        log.info('LS?')
-        self.__connection.send('LS?\n')
-        time.sleep(1)
-        response = self.__connection.recbuf
-        response = response[3:].strip()
-        log.info(response)
-        command = f'add DCW,{voltage},{hi_limit},{lo_limit:.1f},{ramp_up:.1f},{dwell:.1f},{ramp_down:.1f},' \
-                  f'{charge_lo:.1f},{arc_sense},{ramp_hi},{arc_detect},{continuity}'
-
-        log.info(command)
-        if command.find(response) <= 0:
-            log.debug('Stored Step params do not match actual config')
-            log.debug('Send SD')
-            self.__connection.send('SD\n', expectphrase='006', timeout=1)
-            log.debug(command)
-            self.__connection.send(f'{command}\n', expectphrase='006', timeout=1)
-            log.debug('FS')
-            self.__connection.send('FS\n', expectphrase='006', timeout=1)
+        command, seconds = self.dc_hipot_step(voltage, hi_limit, lo_limit, ramp_up, dwell, charge_lo, arc_sense,
+                                              ramp_hi, arc_detect, ramp_down, continuity)
+        self.program_step(command)
         self.start_test()
 
         if margin_test:
             log.info('Start DCW margin test')
-            test_status = self.margin_test_data_result()
+            test_status = self.margin_test_data_result(seconds)
         else:
             log.debug('Start DCW test')
-            test_status = self.test_data_result()
+            test_status = self.test_data_result(seconds)
 
         return test_status
 
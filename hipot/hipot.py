@@ -1,31 +1,137 @@
+import time
+import inspect
 import logging
+import functools
+import threading
 import importlib
+import contextlib
+from engine import locks
+from hipot import measurements
 
 log = logging.getLogger(__name__)
 
 
+def hold_lock(func):
+    """Runs the handler method holding the instrument lock, when the handler has one."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.locked():
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+def cancellable(func):
+    """Runs the handler test method with the cancel Event of the HipotRun running it, a new one for a blocking call."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        run = self.run
+        self.driver.cancel = run.event if run and run.thread is threading.current_thread() else threading.Event()
+        return func(self, *args, **kwargs)
+    return wrapper
+
+
+class HipotRun(object):
+    """Hipot test running in a background thread, returned by the HipotHandler start_* methods.
+
+    Usage:
+
+    run = handler.start_ac_hipot(voltage=1250)
+    do other test work meanwhile
+    result = run.result(timeout=30)
+    """
+
+    def __init__(self, handler, test, kwargs):
+        self.handler = handler
+        self.test = test
+        self.cancelled = False
+        self.event = threading.Event()
+        self._result = None
+        self._error = None
+        self.thread = threading.Thread(target=self._run, args=(kwargs,), name=f'hipot::{test}', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self, kwargs):
+        try:
+            self._result = getattr(self.handler, self.test)(**kwargs)
+        except Exception as e:
+            self._error = e
+
+    def done(self):
+        """True once the test ended, passed, failed or cancelled."""
+        return not self.thread.is_alive()
+
+    def wait(self, timeout=None):
+        """Waits up to timeout seconds, forever by default, for the test to end. Returns done()."""
+        self.thread.join(timeout)
+        return self.done()
+
+    def result(self, timeout=None):
+        """Waits for the test and returns what the *_test method returned, None if it was cancelled.
+
+        The exception raised by the test is raised again here.
+        """
+        if not self.wait(timeout):
+            raise Exception(f'hipot {self.test} still running after {timeout} s')
+        if self._error and not self.cancelled:
+            raise self._error
+        return self._result
+
+    def cancel(self, timeout=None):
+        """Stops polling the instrument and aborts the test with RESET, waits up to timeout seconds for the test to
+        end, forever by default. Returns done().
+
+        The driver sends RESET while it still holds the instrument lock. A run cancelled before TEST never starts it,
+        nor waits for the instrument lock any longer when it is queued for it.
+        """
+        log.info('Cancel hipot %s', self.test)
+        self.cancelled = True
+        self.event.set()
+        return self.wait(timeout)
+
+
 class HipotHandler(object):
 
-    def __init__(self, driver, connection):
+    def __init__(self, driver, connection, lock=None, config_ttl=None, seq_file=None):
         """
         HipotHandler initialization imports a particular instrument driver and opens
         a telnet connection
 
         Param: driver: is the hipot driver module name to be imported
                connection: is the hipot telnet connection created in the station config
+               lock: name of the engine.locks.ContainerLock held while using the instrument, when the hipot tester
+                     is shared between containers
+               config_ttl: seconds a step config programmed stays trusted without reading it back with LS?,
+                           hipot.config_cache.TTL by default
+               seq_file: number of the instrument file the sequence tests rewrite, 4 by default. It is only created
+                         and written by safety_test and margin_search
         Return: None
 
         Example:
         driver_instance = HipotHandler(hipot_model,hipot_connection_object)
+        driver_instance = HipotHandler(hipot_model, hipot_connection_object, lock='hipot')
         """
         self.__connection = connection
-        self.__connection.open()
         self.__hipot_type = driver
-        log.info('Hipot handler is connected')
-        module = importlib.import_module(f"{__name__.rsplit('.', 1)[0]}.driver.{driver}")
-        self.driver = module.Driver(self.__connection)
+        self.lock = lock
+        self.run = None
+        with self.locked():
+            self.__connection.open()
+            log.info('Hipot handler is connected')
+            module = importlib.import_module(f"{__name__.rsplit('.', 1)[0]}.driver.{driver}")
+            self.driver = module.Driver(self.__connection)
+            self.driver.config_ttl = config_ttl if config_ttl else self.driver.config_ttl
+            self.driver.seq_file = seq_file if seq_file else self.driver.seq_file
         log.info('Module imported')
 
+    def locked(self):
+        """The instrument lock, given up by a HipotRun cancelled while queued for it."""
+        run = self.run
+        cancel = run.event if run and run.thread is threading.current_thread() else None
+        return locks.ContainerLock(self.lock, cancel=cancel) if self.lock else contextlib.nullcontext()
+
     def close(self):
         """
         Close the hipot instrument telnet connection
@@ -33,24 +139,66 @@ class HipotHandler(object):
         """
         self.__connection.close()
 
+    def timing_report(self):
+        """
+        Logs and returns the seconds waited for the instrument against the former fixed sleeps, per *RST and test
+        """
+        report = self.driver.timing_report()
+        log.info(report)
+        return report
+
+    def enable_sampling(self, rate=10, size=4096):
+        """
+        Samples TD? rate times per second during ramp and dwell of the following tests, instead of waiting for the
+        programmed times, and keeps the last size readings
+        Return: the hipot.measurements.MeasurementBuffer the readings are appended to
+        """
+        self.driver.samples = measurements.MeasurementBuffer(int(size), interval=1 / float(rate))
+        return self.driver.samples
+
+    def disable_sampling(self):
+        self.driver.samples = None
+
+    def measurement_summary(self, field='reading', run=None, step=None, status=None):
+        """
+        Returns count, min, max, mean and slope per second of field over the readings sampled
+        Param: field: (str) voltage, reading, the current or resistance, or elapsed
+               run: (int) test run, the last one by default, 0 for every run kept
+               step: (int) step of the readings, every step by default
+               status: (str) status of the readings, e.g. Dwell, every status by default
+
+        Example:
+        driver_instance.enable_sampling(rate=20)
+        driver_instance.ac_hipot_test(voltage=1250, dwell=5)
+        drift = driver_instance.measurement_summary('reading', status='Dwell')['slope']
+        """
+        if self.driver.samples is None:
+            raise Exception('hipot sampling is not enabled, see enable_sampling')
+        return self.driver.samples.summary(field, run=run, step=int(step) if step else None, status=status)
+
+    @hold_lock
     def reset_instrument(self):
         """
         Reset the instrument to original power on configuration
         """
         self.driver.reset_instrument()
 
+    @hold_lock
     def check_interlock(self):
         """
         Reset the instrument to original power on configuration
         """
         return self.driver.check_interlock()
 
+    @hold_lock
     def check_cal_due(self):
         """
         This function will check when will expired the calibration in hipot equipment
         """
         return self.driver.check_cal_due()
 
+    @hold_lock
+    @cancellable
     def continuity_test(self, current=25, voltage=8, hi_limit=100, lo_limit=0, hi_limit_v=6.00, lo_limit_v=0.00,
                         dwell=1, offset=0, offset_v=0.00, frequency=60, margin_test=False):
         """
@@ -74,6 +222,8 @@ class HipotHandler(object):
         return self.driver.continuity_test(current, voltage, hi_limit, lo_limit, hi_limit_v, lo_limit_v, dwell, offset,
                                            offset_v, frequency, margin_test)
 
+    @hold_lock
+    @cancellable
     def ac_hipot_test(self, voltage=1200, hi_limit_t=10, lo_limit_t=0, ramp_up=1, dwell=1, arc_sense=5, frequency=60,
                       ramp_down=None, hi_limit_r=None, lo_limit_r=None, arc_detect=None, continuity=None,
                       arc_fail=None, margin_test=False):
@@ -102,13 +252,15 @@ class HipotHandler(object):
         Example:
         """
         log.info(self.__hipot_type)
-        if self.__hipot_type in ['omnia', 'omnia2']:
+        if self.__hipot_type in ['omnia', 'omnia2', 'hypot_ultra']:
             return self.driver.ac_hipot_test(voltage, hi_limit_t, lo_limit_t, ramp_up, dwell, arc_sense, frequency,
                                              ramp_down, hi_limit_r, lo_limit_r, arc_detect, continuity, margin_test)
         else:
             return self.driver.ac_hipot_test(voltage, hi_limit_t, lo_limit_t, ramp_up, dwell, arc_sense, frequency,
                                              arc_fail)
 
+    @hold_lock
+    @cancellable
     def dc_hipot_test(self, voltage=1500, hi_limit=10000, lo_limit=0, ramp_up=0, dwell=1, ramp_down=None,
                       charge_lo=0, arc_sense=5, offset=0, ramp_hi=0, arc_detect='OFF', continuity='OFF', range='AUTO',
                       low_range='OFF', margin_test=False):
@@ -146,6 +298,142 @@ class HipotHandler(object):
         return self.driver.dc_hipot_test(voltage, hi_limit, lo_limit, ramp_up, dwell, ramp_down, charge_lo, arc_sense,
                                          offset, ramp_hi, arc_detect, continuity, range, low_range, margin_test)
 
+    @hold_lock
+    @cancellable
+    def safety_test(self, continuity=None, ac_hipot=None, dc_hipot=None):
+        """
+        Runs continuity, AC hipot and DC hipot tests as the consecutive steps of one setup file, with a single TEST
+        under fail stop, instead of one reset, file load and TEST per test
+        Param: continuity: (dict) keyword arguments of continuity_test, None to skip the step
+               ac_hipot: (dict) keyword arguments of ac_hipot_test, None to skip the step
+               dc_hipot: (dict) keyword arguments of dc_hipot_test, None to skip the step
+        Return: list of dict per step run: step, test, status, passed and data, the meter readings. The steps
+                after a failure have an empty status.
+
+        Example:
+        results = driver_instance.safety_test(continuity={}, ac_hipot={'voltage': 1250}, dc_hipot={'dwell': 2})
+        passed = all(step['passed'] for step in results)
+        """
+        tests = (('continuity', continuity), ('ac_hipot', ac_hipot), ('dc_hipot', dc_hipot))
+        steps = [self.sequence_step(test, kwargs) for test, kwargs in tests if kwargs is not None]
+        results = self.driver.sequence_test(steps)
+        [log.info('Step %s %s: %s %s', r['step'], r['test'], r['status'], ','.join(r['data'])) for r in results]
+        return results
+
+    def margin_search(self, test='ac_hipot', parameter='voltage', low=0, high=None, resolution=10, max_voltage=None,
+                      **kwargs):
+        """
+        Finds the value of parameter where test turns from pass to fail, e.g. the breakdown voltage or the current
+        limit, by bisection between low and high. Every run is a one step safety_test, so the step config cache
+        spares the readback of the values already programmed.
+        Param: test: (str) continuity, ac_hipot or dc_hipot
+               parameter: (str) keyword argument of the test searched, voltage or a limit
+               low: (int) one end of the search, the other end is high
+               high: (int)
+               resolution: (int) the search stops once the passing and failing values are this close
+               max_voltage: (int) no run is made above this voltage, the voltage searched or the one of kwargs, the
+                            default of the test otherwise
+               kwargs: the other keyword arguments of the test
+        Return: dict: passing and failing, the closest values found on each side, failing is None when the test
+                passes on the whole range and passing None when it fails on the whole range, runs, the number of
+                instrument runs, seconds, the total time, and history, the (value, status) of every run
+
+        Example:
+        margin = driver_instance.margin_search('ac_hipot', 'voltage', low=1000, high=3000, resolution=25,
+                                               max_voltage=3000, hi_limit_t=10)
+        """
+        if high is None:
+            raise Exception('margin_search needs the high end of the search')
+
+        def check_voltage(value):
+            voltage = self.test_arguments(test, dict(kwargs, **{parameter: value}))['voltage']
+            if max_voltage is not None and float(voltage) > float(max_voltage):
+                raise Exception(f'margin_search {parameter}={value} runs at {voltage} V, above max_voltage '
+                                f'{max_voltage}')
+
+        [check_voltage(value) for value in (low, high)]
+        start = time.monotonic()
+        history = []
+
+        def passed(value):
+            check_voltage(value)
+            result = self.safety_test(**{test: dict(kwargs, **{parameter: value})})[0]
+            history.append((value, result['status']))
+            log.info('Margin %s %s=%s: %s', test, parameter, value, result['status'])
+            return result['passed']
+
+        high_passed, low_passed = passed(high), passed(low)
+        if high_passed == low_passed:
+            passing, failing = (high, None) if high_passed else (None, low)
+        else:
+            passing, failing = (high, low) if high_passed else (low, high)
+        while passing is not None and failing is not None and abs(passing - failing) > resolution:
+            value = low + round(((passing + failing) / 2 - low) / resolution) * resolution
+            if value in (passing, failing):
+                break
+            passing, failing = (value, failing) if passed(value) else (passing, value)
+
+        margin = {'passing': passing, 'failing': failing, 'runs': len(history),
+                  'seconds': time.monotonic() - start, 'history': history}
+        log.info('Margin %s %s: passing %s, failing %s, %s runs in %.1f s', test, parameter, passing, failing,
+                 margin['runs'], margin['seconds'])
+        return margin
+
+    def test_arguments(self, test, kwargs):
+        """
+        Returns kwargs completed with the defaults of the matching *_test method, margin_test left out
+        """
+        arguments = inspect.signature(getattr(HipotHandler, f'{test}_test')).bind(self, **kwargs)
+        arguments.apply_defaults()
+        arguments = dict(arguments.arguments)
+        [arguments.pop(name) for name in ('self', 'margin_test')]
+        return arguments
+
+    def sequence_step(self, test, kwargs):
+        """
+        Returns the driver (add command, seconds) of test, with the defaults of the matching *_test method
+        """
+        return getattr(self.driver, f'{test}_step')(**self.test_arguments(test, kwargs))
+
+    def start(self, test, **kwargs):
+        """
+        Starts test, the name of a *_test method, in a background thread with kwargs and returns its HipotRun.
+        The instrument connection must not be used by anything else until the run is done.
+        """
+        if self.run and not self.run.done():
+            raise Exception(f'hipot {self.run.test} is still running')
+        self.run = HipotRun(self, test, kwargs)
+        return self.run.start()
+
+    def start_continuity(self, **kwargs):
+        """
+        Same as continuity_test without blocking, returns a HipotRun with done(), wait(timeout), result() and cancel()
+
+        Example:
+        run = driver_instance.start_continuity(dwell=2)
+        status = run.result()
+        """
+        return self.start('continuity_test', **kwargs)
+
+    def start_ac_hipot(self, **kwargs):
+        """
+        Same as ac_hipot_test without blocking, returns a HipotRun with done(), wait(timeout), result() and cancel()
+        """
+        return self.start('ac_hipot_test', **kwargs)
+
+    def start_dc_hipot(self, **kwargs):
+        """
+        Same as dc_hipot_test without blocking, returns a HipotRun with done(), wait(timeout), result() and cancel()
+        """
+        return self.start('dc_hipot_test', **kwargs)
+
+    def start_safety(self, **kwargs):
+        """
+        Same as safety_test without blocking, returns a HipotRun with done(), wait(timeout), result() and cancel()
+        """
+        return self.start('safety_test', **kwargs)
+
+    @hold_lock
     def stop_test(self):
         """
         Resets the instrument. If a failure condition occurs during a test, pressing this button will reset the
@@ -0,0 +1,111 @@
+import math
+import time
+from array import array
+
+
+def number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class MeasurementBuffer(object):
+    """Ring buffer of the TD? readings sampled during ramp and dwell, kept in array columns.
+
+    Usage:
+
+    samples = MeasurementBuffer(size=4096, interval=.1)
+    samples.append_fields(['01', 'ACW', 'Dwell', '1250', '0.612', '0.8'])
+    samples.summary('reading', status='Dwell')
+
+    Every sample holds the run it belongs to, a time.time timestamp, the step, the status, the voltage, the reading,
+    current or resistance depending on the test, and the elapsed seconds shown by the instrument. Once size samples
+    are kept, the oldest ones are overwritten.
+    """
+
+    COLUMNS = (('run', 'I'), ('timestamp', 'd'), ('step', 'H'), ('status', 'B'), ('voltage', 'd'), ('reading', 'd'),
+               ('elapsed', 'd'))
+
+    def __init__(self, size=4096, interval=.1):
+        """
+        :param int size: number of samples kept.
+        :param float interval: seconds between two TD? while sampling.
+        """
+        self.size = size
+        self.interval = interval
+        self.columns = dict((name, array(code, [0]) * size) for name, code in self.COLUMNS)
+        self.statuses = []
+        self.run = 0
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def start_run(self):
+        """Starts a new test run, the summaries cover the last run by default."""
+        self.run += 1
+
+    def append(self, timestamp, step, status, voltage, reading, elapsed):
+        if status not in self.statuses:
+            self.statuses.append(status)
+        i = self._next
+        for name, value in (('run', self.run), ('timestamp', timestamp), ('step', step),
+                            ('status', self.statuses.index(status)), ('voltage', voltage), ('reading', reading),
+                            ('elapsed', elapsed)):
+            self.columns[name][i] = value
+        self._next = (i + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+
+    def append_fields(self, fields, timestamp=None):
+        """Appends the fields of a TD? reply: step, test, status, voltage, reading and elapsed seconds."""
+        if len(fields) < 3 or not fields[0].isdigit():
+            return
+        fields = fields + [''] * (6 - len(fields))
+        self.append(timestamp if timestamp else time.time(), int(fields[0]), fields[2], number(fields[3]),
+                    number(fields[4]), number(fields[5]))
+
+    def indexes(self):
+        start = (self._next - self._count) % self.size
+        return [(start + i) % self.size for i in range(self._count)]
+
+    def samples(self, run=None, step=None, status=None):
+        """
+        :param int run: run of the samples, the last one by default, 0 for every run kept.
+        :param int step: step of the samples, every step by default.
+        :param str status: status of the samples, e.g. 'Dwell', every status by default.
+        :return: list of (run, timestamp, step, status, voltage, reading, elapsed) in the order they were taken.
+        """
+        run = self.run if run is None else run
+        columns = [self.columns[name] for name, _ in self.COLUMNS]
+        samples = []
+        for i in self.indexes():
+            sample = [column[i] for column in columns]
+            sample[3] = self.statuses[sample[3]]
+            if (not run or sample[0] == run) and (step is None or sample[2] == step) and \
+                    (status is None or sample[3] == status):
+                samples.append(tuple(sample))
+        return samples
+
+    def summary(self, field='reading', run=None, step=None, status=None):
+        """Returns min, max, mean and slope, the least squares change per second, of field over the samples selected.
+
+        :param str field: voltage, reading or elapsed.
+        :return dict: count, min, max, mean and slope, None values when there is no sample.
+        """
+        position = [name for name, _ in self.COLUMNS].index(field)
+        points = [(sample[1], sample[position]) for sample in self.samples(run, step, status)
+                  if not math.isnan(sample[position])]
+        if not points:
+            return {'count': 0, 'min': None, 'max': None, 'mean': None, 'slope': None}
+        values = [value for _, value in points]
+        mean_t = sum(t for t, _ in points) / len(points)
+        mean = sum(values) / len(values)
+        variance = sum((t - mean_t) ** 2 for t, _ in points)
+        slope = sum((t - mean_t) * (value - mean) for t, value in points) / variance if variance else 0.0
+        return {'count': len(points), 'min': min(values), 'max': max(values), 'mean': mean, 'slope': slope}
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
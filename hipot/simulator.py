@@ -0,0 +1,342 @@
+import os
+import tty
+import time
+import random
+import socket
+import logging
+import argparse
+import threading
+import socketserver
+
+log = logging.getLogger(__name__)
+
+# index of (ramp up, dwell, ramp down) in the fields of the add command of each step type, the type being field 0
+TIMES = {('ADD', 'GND'): (None, 5, None), ('ADD2', 'GND'): (None, 7, None),
+         ('ADD', 'ACW'): (4, 5, 7), ('ADD2', 'ACW'): (4, 5, 7),
+         ('ADD', 'DCW'): (4, 5, 6), ('ADD2', 'DCW'): (4, 5, 6)}
+
+
+def number(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class Step(object):
+    """A test step added to a setup file, with its timing and the readings the simulated DUT gives."""
+
+    def __init__(self, command, fields):
+        self.command = command
+        self.type = fields[0].upper()
+        self.fields = fields
+        ramp_up, dwell, ramp_down = TIMES.get((command, self.type), (None, 5, None))
+        self.ramp_up = number(fields[ramp_up]) if ramp_up and ramp_up < len(fields) else 0.0
+        self.dwell = number(fields[dwell]) if dwell < len(fields) else 0.0
+        self.ramp_down = number(fields[ramp_down]) if ramp_down and ramp_down < len(fields) else 0.0
+        self.voltage = number(fields[2] if self.type == 'GND' else fields[1])
+        self.hi_limit = number(fields[3] if self.type == 'GND' else fields[2])
+        self.lo_limit = number(fields[4] if self.type == 'GND' else fields[3])
+
+    @property
+    def duration(self):
+        return self.ramp_up + self.dwell + self.ramp_down
+
+    def __str__(self):
+        return ','.join([self.type] + self.fields[1:])
+
+
+class Instrument(object):
+    """Associated Research HypotULTRA/Omnia simulator answering the commands used by hipot/driver.
+
+    Commands are acknowledged with ack and a new line, '006' satisfies both the Omnia ('006') and the HypotULTRA
+    ('\\n') drivers. The DUT draws leakage_ac mA/kV in ACW, leakage_dc uA/kV in DCW and has a resistance mOhm ground
+    bond, its insulation breaks down above breakdown volts. fail forces the status of a step type, e.g.
+    {'ACW': 'Arc-Fail'}, and fail_rate is the probability of an Arc-Fail on any step.
+    """
+
+    def __init__(self, model='7704', serial='SIM0001', firmware='1.0', ack='006', latency=0.0, reset_time=.5,
+                 leakage_ac=.5, leakage_dc=1.0, resistance=50.0, breakdown=None, fail=None, fail_rate=0.0, seed=None):
+        self.model = model
+        self.serial = serial
+        self.firmware = firmware
+        self.ack = ack
+        self.latency = latency
+        self.reset_time = reset_time
+        self.leakage_ac = leakage_ac
+        self.leakage_dc = leakage_dc
+        self.resistance = resistance
+        self.breakdown = breakdown
+        self.fail = fail if fail else {}
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.files = {}
+        self.loaded = None
+        self.step = 1
+        self.fail_stop = True
+        self.ready_at = 0.0
+        self.started = None
+        self.outcomes = []
+        self.aborted = None
+
+    def handle(self, line):
+        """Runs one command line and returns the reply, None for an empty line."""
+        line = line.strip()
+        if not line:
+            return None
+        time.sleep(self.latency) if self.latency else None
+        command, _, args = line.partition(' ')
+        command = command.upper()
+        with self.lock:
+            try:
+                reply = self.dispatch(command, args.strip())
+            except (KeyError, IndexError, ValueError):
+                reply = None
+        log.debug('%s -> %s', line, reply)
+        return f'{reply if reply is not None else "021"}\n'
+
+    def dispatch(self, command, args):
+        if command == '*IDN?':
+            return f'ASSOCIATED RESEARCH,{self.model},{self.serial},{self.firmware}'
+        if command == '*RST':
+            self.abort()
+            self.loaded, self.step, self.fail_stop = None, 1, True
+            self.ready_at = time.monotonic() + self.reset_time
+            return self.ack
+        if command == '*OPC?':
+            time.sleep(max(0.0, self.ready_at - time.monotonic()))
+            return '1'
+        if command == 'LF':
+            n = int(args.rstrip('?'))
+            return f'{n:02d},{self.files[n]["name"]}' if n in self.files else f'{n:02d},'
+        if command == 'FD':
+            self.files.pop(int(args), None)
+            self.loaded = None if self.loaded == int(args) else self.loaded
+            return self.ack
+        if command == 'FN':
+            n, name = args.split(',', 1)
+            self.files[int(n)] = {'name': name.strip(), 'steps': []}
+            return self.ack
+        if command == 'FT?':
+            return str(len(self.files))
+        if command == 'FL':
+            if int(args) not in self.files:
+                return None
+            self.abort()
+            self.loaded, self.step = int(args), 1
+            return self.ack
+        if command == 'SS':
+            self.step = int(args)
+            return self.ack
+        if command == 'LS?':
+            return f'{self.step:02d},{self.steps[self.step - 1]}'
+        if command == 'SD':
+            del self.steps[self.step - 1]
+            return self.ack
+        if command in ('ADD', 'ADD2'):
+            self.steps.append(Step(command, [field.strip() for field in args.split(',')]))
+            return self.ack
+        if command == 'FS':
+            return self.ack if self.loaded in self.files else None
+        if command == 'SF':
+            self.fail_stop = args.strip() == '1'
+            return self.ack
+        if command == 'TEST':
+            if not self.steps:
+                return None
+            self.start()
+            return self.ack
+        if command == 'TD?':
+            return self.data()
+        if command == 'RD':
+            return self.data(int(args.rstrip('?')))
+        if command == 'RESET':
+            self.abort()
+            return self.ack
+        if command == 'RI?':
+            return '1'
+        if command == 'SCDU?':
+            return '12,31,29'
+        return None
+
+    @property
+    def steps(self):
+        return self.files[self.loaded]['steps']
+
+    def start(self):
+        """Works out, when the test starts, how long every step runs and how it ends."""
+        self.started = time.monotonic()
+        self.aborted = None
+        self.outcomes = []
+        offset = 0.0
+        for step in self.steps:
+            status, length = self.outcome(step)
+            self.outcomes.append((step, offset, length, status))
+            offset += length
+            if status != 'Pass' and self.fail_stop:
+                break
+
+    def outcome(self, step):
+        """:return: (final status, seconds the step runs)"""
+        forced = self.fail.get(step.type)
+        if not forced and self.fail_rate and self.random.random() < self.fail_rate:
+            forced = 'Arc-Fail'
+        if forced:
+            return forced, step.ramp_up
+        limit = self.threshold(step)
+        if limit is not None and limit <= step.voltage:
+            return 'HI-Limit', step.ramp_up * limit / step.voltage if step.voltage else 0.0
+        if step.lo_limit and self.meter(step, step.voltage) < step.lo_limit:
+            return 'LO-Limit', step.ramp_up + step.dwell
+        return 'Pass', step.duration
+
+    def threshold(self, step):
+        """Volts at which the reading reaches the HI limit, None if it never does."""
+        if step.type == 'GND':
+            return 0.0 if step.hi_limit and self.resistance > step.hi_limit else None
+        leakage = self.leakage_ac if step.type == 'ACW' else self.leakage_dc
+        limits = [step.hi_limit * 1000 / leakage] if step.hi_limit and leakage else []
+        limits += [self.breakdown] if self.breakdown else []
+        return min(limits) if limits else None
+
+    def meter(self, step, voltage):
+        if step.type == 'GND':
+            return self.resistance
+        leakage = self.leakage_ac if step.type == 'ACW' else self.leakage_dc
+        reading = leakage * voltage / 1000
+        return reading * 100 if self.breakdown and voltage >= self.breakdown else reading
+
+    def abort(self):
+        if self.started is not None and self.aborted is None and self.running():
+            self.aborted = time.monotonic() - self.started
+
+    def running(self):
+        if not self.outcomes:
+            return False
+        _, offset, length, _ = self.outcomes[-1]
+        return time.monotonic() - self.started < offset + length
+
+    def data(self, n=None):
+        """TD? reply, the step running or the last one run, or RD <n>? reply."""
+        if self.started is None:
+            return f'{self.step:02d},,Reset,0,0,0.0'
+        elapsed = time.monotonic() - self.started if self.aborted is None else self.aborted
+        if n is not None:
+            if n > len(self.outcomes):
+                return f'{n:02d},{self.steps[n - 1].type},,,,'
+            return self.reading(n, elapsed)
+        current = [n for n, (_, offset, _, _) in enumerate(self.outcomes, 1) if elapsed >= offset]
+        return self.reading(current[-1] if current else 1, elapsed)
+
+    def reading(self, number, elapsed):
+        step, offset, length, status = self.outcomes[number - 1]
+        t = min(max(0.0, elapsed - offset), length)
+        if elapsed < offset:
+            return f'{number:02d},{step.type},,,,'
+        if elapsed < offset + length:
+            if self.aborted is not None:
+                status = 'Abort'
+            elif t < step.ramp_up:
+                status = 'Ramp Up'
+            elif t < step.ramp_up + step.dwell:
+                status = 'Dwell'
+            else:
+                status = 'Ramp Down'
+        if t < step.ramp_up:
+            voltage = step.voltage * t / step.ramp_up
+        elif t < step.ramp_up + step.dwell or status != 'Pass':
+            voltage = step.voltage
+        else:
+            voltage = step.voltage * max(0.0, 1 - (t - step.ramp_up - step.dwell) / step.ramp_down) \
+                if step.ramp_down else step.voltage
+        meter = self.meter(step, voltage)
+        meter = max(meter, step.hi_limit) if status == 'HI-Limit' else meter
+        return f'{number:02d},{step.type},{status},{voltage:.0f},{meter:.3f},{t:.1f}'
+
+
+class Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        for line in self.rfile:
+            reply = self.server.instrument.handle(line.decode(errors='replace'))
+            self.wfile.write(reply.encode()) if reply else None
+
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, instrument, host='127.0.0.1', port=5025):
+        super().__init__((host, port), Handler)
+        self.instrument = instrument
+
+
+def serve_tcp(instrument, host='127.0.0.1', port=5025):
+    """Serves instrument on a TCP port, to connect with Client('telnet', host, port=port, transport='native')."""
+    server = Server(instrument, host, port)
+    log.info('Hipot simulator listening on %s:%s', *server.server_address)
+    server.serve_forever()
+
+
+def open_pty():
+    """:return: (master fd, path of the tty to open with Client('serial', port=path, transport='native'))"""
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    return master, slave, os.ttyname(slave)
+
+
+def serve_pty(instrument, master):
+    buffer = b''
+    while True:
+        data = os.read(master, 4096)
+        if not data:
+            return
+        buffer += data.replace(b'\r', b'\n')
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            reply = instrument.handle(line.decode(errors='replace'))
+            os.write(master, reply.encode()) if reply else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Associated Research hipot tester simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5025, help='TCP port to listen on')
+    parser.add_argument('--pty', action='store_true', help='serve on a pseudo terminal instead of TCP')
+    parser.add_argument('--model', default='7704', help='7704, 7854 or 8204')
+    parser.add_argument('--serial', default='SIM0001')
+    parser.add_argument('--ack', default='006', help='reply to the commands that are not queries')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before every reply')
+    parser.add_argument('--reset-time', type=float, default=.5, help='seconds before *OPC? answers after *RST')
+    parser.add_argument('--leakage-ac', type=float, default=.5, help='mA per kV in ACW')
+    parser.add_argument('--leakage-dc', type=float, default=1.0, help='uA per kV in DCW')
+    parser.add_argument('--resistance', type=float, default=50.0, help='ground bond mOhm')
+    parser.add_argument('--breakdown', type=float, default=None, help='volts the insulation breaks down at')
+    parser.add_argument('--fail', action='append', default=[], metavar='TYPE=STATUS',
+                        help='force the status of a step type, e.g. ACW=Arc-Fail')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='probability of an Arc-Fail per step')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format='%(asctime)s %(message)s')
+
+    instrument = Instrument(model=args.model, serial=args.serial, ack=args.ack, latency=args.latency,
+                            reset_time=args.reset_time, leakage_ac=args.leakage_ac, leakage_dc=args.leakage_dc,
+                            resistance=args.resistance, breakdown=args.breakdown,
+                            fail=dict((t.upper(), s) for t, s in (f.split('=', 1) for f in args.fail)),
+                            fail_rate=args.fail_rate, seed=args.seed)
+    try:
+        if args.pty:
+            master, slave, path = open_pty()
+            print(path, flush=True)
+            serve_pty(instrument, master)
+        else:
+            serve_tcp(instrument, args.host, args.port)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
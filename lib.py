@@ -1,4 +1,5 @@
 import re
+import importlib
 from engine import conn
 from engine import logger as log
 from engine import sequence
@@ -6,16 +7,26 @@ from engine import sync_groups
 from engine import initialize
 from engine import questions
 from engine import utils
-from psu import power_control
-from hipot import hipot
 
 
-RDB = utils.RDB
 apdicts = utils.APDicts()
-get_variables = utils.get_variables()
-PowerControlHandler = power_control.PowerControlHandler
-HipotHandler = hipot.HipotHandler
 TimeIt = utils.TimeIt
+LAZY_ATTRIBUTES = {'RDB': ('engine.redis_lib', 'RDB'),
+                   'PowerControlHandler': ('psu.power_control', 'PowerControlHandler'),
+                   'HipotHandler': ('hipot.hipot', 'HipotHandler')}
+
+
+def __getattr__(name):
+    """Resolves the handlers, the Redis client and the Robot variables on first access only (PEP 562)."""
+    if name == 'get_variables':
+        value = utils.get_variables()
+    elif name in LAZY_ATTRIBUTES:
+        module, attribute = LAZY_ATTRIBUTES[name]
+        value = getattr(importlib.import_module(module), attribute)
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
 
 
 def ask_questions(question, picture_path, html, timeout=60):
@@ -75,7 +86,7 @@ def add_sync_containers():
     sync_groups.add_sync_containers()
 
 
-def sync_group(group_name, timeout=60):
+def sync_group(group_name, timeout=60, leader=None, **kwargs):
     """Used to sync a group of containers
 
         This function will synchronize containers defined by group_name using:
@@ -94,12 +105,36 @@ def sync_group(group_name, timeout=60):
         :param str group_name: The name (unique within a Test Station) of the group of containers to sync with.
         :param int timeout: Will raise timeout exception if synchronization takes longer than timeout (in seconds).
             this includes the time it takes the leader to do its option function, default is 1 minutes.
+        :param (str | callable) leader: the leader function or its 'package.module.function' path, optional.
+            An exception raised by the leader function is raised by this function in all containers.
         :param dict kwargs: parameter/s to be passed to the leader function, optional.
-        :return: the result of the leader function called or None if nothing.
+        :return: the result of the leader function called, True if there is no leader function.
         """
 
     return sync_groups.sync_group(group_name=group_name,
-                                  timeout=timeout)
+                                  timeout=timeout,
+                                  leader=leader,
+                                  **kwargs)
+
+
+def sync_gather(group_name, value, timeout=60):
+    """Used to share one value per container within a sync group
+
+        Every running container of the group rendezvous at this function, like with sync_group, leaving its
+        value. Once all of them arrived, the values are read back in a single request and returned to everyone.
+
+        Example:
+            readings = sync_gather('leakage', measured_current)
+            worst_slot = max(readings, key=readings.get)
+
+        :param str group_name: The name (unique within a Test Station) of the group of containers to sync with.
+        :param value: the value of this container, any picklable object.
+        :param int timeout: Will raise timeout exception if synchronization takes longer than timeout (in seconds).
+        :return dict: the value of every container keyed by container name.
+        """
+    return sync_groups.sync_gather(group_name=group_name,
+                                   value=value,
+                                   timeout=timeout)
 
 
 def get_sync_container():
@@ -128,7 +163,7 @@ def get_running_sync_containers():
     return sync_groups.get_running_sync_containers()
 
 
-def cache_data(k: str, v: str):
+def cache_data(k: str, v: str, ttl: int = None):
     """Used to cache key/value pair information for persistence between process.
 
     Can be used to send data to another container
@@ -136,8 +171,18 @@ def cache_data(k: str, v: str):
     Be careful of not writing from two place at once.
     :param str k: key
     :param str v: value
+    :param int ttl: seconds before the key expires, it never expires by default.
+    """
+    utils.cache_data(k, v, ttl=ttl)
+
+
+def cache_many(mapping: dict, ttl: int = None):
+    """Same as cache_data for several key/value pairs, written in a single round trip.
+
+    :param dict mapping: {key: value} to cache.
+    :param int ttl: seconds before the keys expire, they never expire by default.
     """
-    utils.cache_data(k, v)
+    utils.cache_many(mapping, ttl=ttl)
 
 
 def get_cached_data(k: str):
@@ -150,11 +195,26 @@ def get_cached_data(k: str):
     return utils.get_cached_data(k)
 
 
+def get_many(keys: list):
+    """Returns the values of several keys cached with cache_data or cache_many, read in a single round trip.
+
+    :param list keys: keys to look for in the keyvaluestore
+    :rtype: dict
+    :return: {key: value}, value is None for the keys not found.
+    """
+    return utils.get_many(keys)
+
+
 def delete_cached_data(k: str):
     """Deletes the value and key that was cached with cache_data."""
     utils.delete_cached_data(k)
 
 
+def delete_many(keys: list):
+    """Deletes several keys cached with cache_data or cache_many."""
+    utils.delete_many(keys)
+
+
 def get_station_configuration(**kwargs):
     return conn.StationConfiguration(**kwargs)
 
@@ -193,3 +253,11 @@ def iss_service(func):
 
 def get_variable(key):
     return utils.get_variable(key)
+
+
+def invalidate_variables(*keys):
+    """Drops Robot variables from the per test snapshot, so the next get_variable reads them again.
+
+    :param str keys: variable names such as '${serial_number}', all of them if none is given.
+    """
+    utils.invalidate_variables(*keys)
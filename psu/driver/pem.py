@@ -1,4 +1,5 @@
 import time
+from engine import pool
 
 
 class Driver(object):
@@ -16,10 +17,9 @@ class Driver(object):
         self.power_control(['off', 'on'], port, timeout, time_sleep)
 
     def power_control(self, control, port, timeout, time_sleep=0):
-        self._connection.open()
+        connection = pool.acquire(self._connection, self._prompt)
         for i in control if isinstance(control, list) else [control]:
-            self._connection.send(f'psu_manager psu{port} {i}\r', expectphrase=self._prompt, timeout=timeout)
+            connection.send(f'psu_manager psu{port} {i}\r', expectphrase=self._prompt, timeout=timeout)
             time.sleep(3)
-            self._connection.send(f'psu_manager psu{port} status\r', expectphrase=self._prompt, timeout=timeout)
+            connection.send(f'psu_manager psu{port} status\r', expectphrase=self._prompt, timeout=timeout)
             time.sleep(time_sleep)
-        self._connection.close()
@@ -1,4 +1,5 @@
 import time
+from engine import pool
 
 
 class Driver(object):
@@ -16,8 +17,7 @@ class Driver(object):
         self.power_control(['off', 'on'], port, timeout, time_sleep)
 
     def power_control(self, control, port, timeout, time_sleep=0):
-        self._connection.open()
+        connection = pool.acquire(self._connection, self._prompt)
         for i in control if isinstance(control, list) else [control]:
-            self._connection.send(f'/{i.upper()} {port},Y\r', expectphrase=self._prompt, timeout=timeout)
+            connection.send(f'/{i.upper()} {port},Y\r', expectphrase=self._prompt, timeout=timeout)
             time.sleep(time_sleep)
-        self._connection.close()
@@ -1,14 +1,18 @@
+import contextlib
 from importlib import import_module
+from engine import locks
 
 
 class PowerControlHandler(object):
-    def __init__(self, driver, connection, port=None, timeout=30, time_sleep=5):
+    def __init__(self, driver, connection, port=None, timeout=30, time_sleep=5, lock=None):
         """
         :param driver - is the power control driver module name to be imported:
         :param connection - is the power control ssh or telnet connection created in the station config:
         :param port - port: (str)
         :param timeout - timeout: (int)
         :param time_sleep - time_sleep: (int)
+        :param lock - name of the engine.locks.ContainerLock held during each operation, for PDUs shared between
+                      containers: (str)
         :return None
         Example:
             p = lib.PowerControlHandler(driver='wti', connection=lib.getconnections()['WTI'], port='A1 A2', timeout=10)
@@ -23,6 +27,7 @@ class PowerControlHandler(object):
         self._port = port
         self._timeout = timeout
         self.time_sleep = time_sleep
+        self.lock = lock
         module = import_module(f"{__name__.rsplit('.', 1)[0]}.driver.{driver}")
         self.driver = module.Driver(connection=self._connection)
 
@@ -34,7 +39,8 @@ class PowerControlHandler(object):
         """
         port = port if port else self._port
         timeout = timeout if timeout else self._timeout
-        return self.driver.on(port, timeout)
+        with self.locked():
+            return self.driver.on(port, timeout)
 
     def off(self, port=None, timeout=None):
         """
@@ -44,7 +50,8 @@ class PowerControlHandler(object):
         """
         port = port if port else self._port
         timeout = timeout if timeout else self._timeout
-        return self.driver.off(port, timeout)
+        with self.locked():
+            return self.driver.off(port, timeout)
 
     def cycle(self, port=None, timeout=None, time_sleep=None):
         """
@@ -56,4 +63,8 @@ class PowerControlHandler(object):
         port = port if port else self._port
         timeout = timeout if timeout else self._timeout
         time_sleep = time_sleep if time_sleep else self.time_sleep
-        return self.driver.cycle(port, timeout, time_sleep)
+        with self.locked():
+            return self.driver.cycle(port, timeout, time_sleep)
+
+    def locked(self):
+        return locks.ContainerLock(self.lock) if self.lock else contextlib.nullcontext()